@@ -1,76 +1,387 @@
 import tempfile
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import BackgroundTasks, FastAPI, File, Form, Header, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 import os
 import shutil
-import json
 import logging
+import time
 
 logger = logging.getLogger("uvicorn.error")
 logger.setLevel(logging.DEBUG)
 
-from arelle_fun import convert
+from arelle import Version
+
+from arelle_pool import (PoolBusy, WorkerTimeout, base_args_from_env, conversion_options, pool_from_env,
+                         validation_args, validation_profile_from_env, validation_profiles_from_env)
+from batch import convert_many, extract_filings, is_filing_archive, json_line, summarize, unique_path
+from compression import CompressionMiddleware, accepts, compression_from_env, etag_matches, etag_variant, strong_etag
+import json_codec
+from metrics import TimingMiddleware, counter, gauge, metrics_response_body, observe, register_callback, request_timings
+from profiling import profiler_from_env, request_id_from
+from result_cache import cache_key, result_cache_from_env
+from upload_limits import MaxBodySizeMiddleware, save_upload
+from validation_log import summary_header, validation_reports_from_env
+
+controller_pool = pool_from_env()
+result_cache = result_cache_from_env()
+# What Arelle logged while converting, by result key, in a store of its own next to the result cache
+validation_reports = validation_reports_from_env(result_cache)
+# None unless PROFILE_SAMPLE_RATE or PROFILE_HEADER_ENABLED switch profiling on
+profiler = profiler_from_env()
+
+# Everything besides the uploaded bytes and the validation profile that decides what a conversion produces
+CONVERSION_OPTIONS = [Version.__version__, *base_args_from_env()]
+
+# The validation profile of conversions that do not ask for one, and the profiles they may ask for
+VALIDATION_PROFILE = validation_profile_from_env()
+VALIDATION_PROFILES = validation_profiles_from_env()
+
+# Conversions admitted at once: one per pooled worker plus ARELLE_MAX_QUEUE waiting for one.
+# Anything beyond that is turned away with 503 + Retry-After instead of piling up.
+MAX_QUEUE = int(os.getenv('ARELLE_MAX_QUEUE', '4'))
+QUEUE_WAIT_SECONDS = float(os.getenv('ARELLE_QUEUE_WAIT', '120'))
+RETRY_AFTER_SECONDS = os.getenv('ARELLE_RETRY_AFTER', '30')
+pending_conversions = 0
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the Arelle controllers (and their plugins) once, before the first upload arrives
+    controller_pool.start()
+    yield
+    controller_pool.close()
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse serialised with json_codec (orjson when it is installed)."""
+
+    def render(self, content):
+        return json_codec.dumps(content)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=CodecJSONResponse)
+
+# Uploads are refused with 413 while streaming in, as soon as they pass this size
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=int(os.getenv('ARELLE_MAX_UPLOAD_MB', '512')) * 2**20)
+
+# JSON answers are compressed (zstd / br / gzip, as negotiated) off the event loop
+app.add_middleware(CompressionMiddleware, **compression_from_env())
+
+# Outermost, so "receive" and "send" include the other middlewares' work
+app.add_middleware(TimingMiddleware)
+
+
+def pool_metrics():
+    busy = controller_pool.busy()
+    yield gauge("arelle_pending_conversions", "Conversions admitted, running or waiting for a worker",
+                pending_conversions)
+    yield gauge("arelle_queue_depth", "Conversions waiting for a free worker", max(0, pending_conversions - busy))
+    yield gauge("arelle_workers", "Warmed Arelle workers in the pool", controller_pool.size)
+    yield gauge("arelle_active_workers", "Workers running a conversion", busy)
+    yield gauge("arelle_worker_rss_bytes", "Resident set size of each worker", controller_pool.worker_rss_bytes(),
+                label="worker")
+    yield counter("arelle_workers_recycled", "Workers replaced after max jobs or max RSS",
+                  controller_pool.stats()["recycled"])
+    if result_cache:
+        stats = result_cache.stats()
+        yield counter("arelle_result_cache_lookups", "Result cache lookups by outcome",
+                      {"hit": stats["hits"], "miss": stats["misses"]}, label="result")
+        yield gauge("arelle_result_cache_bytes", "Bytes held by the result cache on disk", stats["bytes"])
+
+
+register_callback(pool_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = metrics_response_body()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/pool/stats")
+async def pool_stats():
+    return CodecJSONResponse(content=controller_pool.stats())
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return CodecJSONResponse(content=result_cache.stats() if result_cache else {"enabled": False})
+
+
+def busy_response(message, background=None):
+    return CodecJSONResponse(
+        content={"error": message},
+        status_code=503,
+        headers={"Retry-After": RETRY_AFTER_SECONDS},
+        background=background
+    )
+
+
+def unknown_validation_profile(validation):
+    return CodecJSONResponse(
+        content={"error": f"Unknown validation profile '{validation}', expected one of: "
+                          f"{', '.join(VALIDATION_PROFILES)}"},
+        status_code=400
+    )
+
+
+def profile_not_found():
+    return CodecJSONResponse(content={"error": "Profile not found"}, status_code=404)
+
+
+@app.get("/profiles")
+async def list_profiles():
+    if profiler is None:
+        return CodecJSONResponse(content={"enabled": False, "profiles": []})
+    return CodecJSONResponse(content={"enabled": True, "profiles": await run_in_threadpool(profiler.profiles)})
+
+
+@app.get("/profiles/{request_id}")
+async def get_profile(request_id: str):
+    """Summaries (slowest functions, top allocations) of the profiles of one request."""
+    summaries = await run_in_threadpool(profiler.summaries, request_id) if profiler else None
+    if not summaries:
+        return profile_not_found()
+    return CodecJSONResponse(content=summaries)
+
+
+@app.get("/profiles/{request_id}/{name}")
+async def get_profile_file(request_id: str, name: str):
+    """One stored file: a .prof for pstats / snakeviz, .folded stacks for a flamegraph or a .json summary."""
+    path = profiler.file(request_id, name) if profiler else None
+    if path is None:
+        return profile_not_found()
+    return FileResponse(path, media_type="application/json" if name.endswith(".json") else "application/octet-stream",
+                        filename=name)
+
+
+@app.get("/validation/{result_key}")
+async def get_validation(result_key: str):
+    """
+    The validation report of the conversion answered with this X-Result-Key: message counts
+    by level and code, and the first messages with their code, level, text and references.
+    """
+    report = await run_in_threadpool(validation_reports.get, result_key)
+    if report is None:
+        return CodecJSONResponse(content={"error": "Validation report not found"}, status_code=404)
+    return CodecJSONResponse(content=report)
 
-app = FastAPI()
 
 @app.post("/convert/")
-async def convert_file(file: UploadFile = File(...)):
+async def convert_file(request: Request, file: UploadFile = File(...), if_none_match: Optional[str] = Header(None),
+                       accept_encoding: Optional[str] = Header(None), x_profile: Optional[str] = Header(None),
+                       x_request_id: Optional[str] = Header(None), validation: Optional[str] = Form(None)):
+    global pending_conversions
     logger.debug("Convert endpoint called")
+    validation = validation or VALIDATION_PROFILE
+    if validation not in VALIDATION_PROFILES:
+        return unknown_validation_profile(validation)
+
+    if pending_conversions >= controller_pool.size + MAX_QUEUE:
+        logger.warning(f"Rejecting conversion, {pending_conversions} already pending")
+        return busy_response("Conversion queue is full, please retry later")
+
+    # Costs nothing unless profiling is switched on; a profiled request is always converted
+    request_id = request_id_from(x_request_id) if profiler and profiler.wanted(x_profile) else None
+
+    pending_conversions += 1
+    try:
+        return await _convert_upload(file, request_timings(request), validation, if_none_match, accept_encoding,
+                                     request_id)
+    finally:
+        pending_conversions -= 1
+
+
+async def _convert_upload(file: UploadFile, timings, validation, if_none_match=None, accept_encoding=None,
+                          profile_request_id=None):
+    # Create a temporary directory; it is removed once the response has been sent
+    temp_dir = tempfile.mkdtemp()
+    cleanup = BackgroundTasks()
+    cleanup.add_task(shutil.rmtree, temp_dir, ignore_errors=True)
+    try:
+        logger.debug(f"Created temporary directory: {temp_dir}")
+
+        # Create paths for temporary files within the temp directory
+        upload_path = os.path.join(temp_dir, "input_file")  # Generic filename
+        json_output_path = os.path.join(temp_dir, "output.json")
+
+        logger.debug(f"upload_path = {upload_path}")
+        logger.debug(f"json_output_path = {json_output_path}")
+
+        # Copy the spooled upload to the temp directory in chunks, hashing it on the way
+        logger.debug("Saving upload file")
+        with timings.stage("write"):
+            content_sha256 = await run_in_threadpool(save_upload, file.file, upload_path)
+        logger.debug("File saved")
+
+        # Identical uploads converted with the same options are answered from the cache.
+        # The key is also returned as X-Result-Key so callers can cache what they derive from it.
+        key = cache_key(content_sha256, CONVERSION_OPTIONS + conversion_options(validation))
 
-    # Create a temporary directory that will be automatically cleaned up
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            logger.debug(f"Created temporary directory: {temp_dir}")
-
-            # Create paths for temporary files within the temp directory
-            upload_path = os.path.join(temp_dir, "input_file")  # Generic filename
-            json_output_path = os.path.join(temp_dir, "output.json")
-
-            logger.debug(f"upload_path = {upload_path}")
-            logger.debug(f"json_output_path = {json_output_path}")
-
-            # Save the uploaded file content to the temp directory
-            logger.debug("Saving upload file")
-            file_content = await file.read()
-            with open(upload_path, 'wb') as buffer:
-                buffer.write(file_content)
-            logger.debug("File saved")
-
-            # Construct the command arguments
-            command = [
-                '-f', upload_path,
-                '--plugins', 'validate/EFM|saveLoadableOIM',
-                f'--saveLoadableOIM={json_output_path}'
-            ]
-
-            logger.debug(f"Calling conversion with command: {command}")
-
-            # Call the convert function
-            convert(command)
-            logger.debug("Conversion successful")
-
-            # Check if the JSON file was created
-            if not os.path.exists(json_output_path):
-                raise Exception("JSON output file was not created after conversion")
-
-            # Read the generated JSON file
-            logger.debug("Reading generated JSON file")
-            with open(json_output_path, 'r', encoding='utf-8') as json_file:
-                json_content = json.load(json_file)
-
-            logger.debug("Successfully read JSON content")
-
-            # Return the JSON content as a response
-            return JSONResponse(content=json_content)
-
-        except Exception as e:
-            logger.error(f"Error during conversion: {str(e)}")
-            return JSONResponse(
-                content={"error": f"XBRL conversion failed: {str(e)}"},
-                status_code=500
+        # The conversion of the same bytes is the same document, so the key is a strong ETag
+        etag = strong_etag(key)
+        if etag_matches(if_none_match, etag):
+            logger.debug(f"Not modified: {key}")
+            return Response(status_code=304, headers={"ETag": etag, "X-Result-Key": key}, background=cleanup)
+
+        if result_cache and not profile_request_id:
+            # The cache holds results gzipped; clients accepting gzip get them without recompressing
+            gzipped = accepts(accept_encoding, "gzip")
+            with timings.stage("cache_read"):
+                cached = await run_in_threadpool(result_cache.get_compressed if gzipped else result_cache.get, key)
+            if cached is not None:
+                logger.debug(f"Result cache hit for {key}")
+                headers = {"ETag": etag, "X-Cache": "HIT", "X-Result-Key": key, "X-Validation-Profile": validation}
+                report = await run_in_threadpool(validation_reports.get, key)
+                if report is not None:
+                    headers["X-Validation-Summary"] = summary_header(report)
+                if gzipped:
+                    headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding",
+                                    "ETag": etag_variant(etag, "gzip")})
+                return Response(content=cached, media_type="application/json", headers=headers,
+                                background=cleanup)
+
+        # Run the conversion on a warmed controller borrowed from the pool
+        logger.debug("Calling conversion on pooled Arelle controller")
+        profile = profiler.options(profile_request_id, "convert") if profile_request_id else None
+        result = await run_in_threadpool(
+            controller_pool.run, upload_path, json_output_path, validation_args(validation),
+            timeout=QUEUE_WAIT_SECONDS, profile=profile
+        )
+        logger.debug(f"Conversion finished in {result['seconds']:.3f}s")
+        report = result["validation"]
+        headers = {"ETag": etag, "X-Cache": "MISS", "X-Result-Key": key, "X-Validation-Profile": validation,
+                   "X-Validation-Summary": summary_header(report)}
+        # Stored before answering: callers fetch /validation/{key} while reading the response
+        await run_in_threadpool(validation_reports.put, key, report)
+        if profile_request_id:
+            logger.info(f"Conversion profiled as {profile_request_id}")
+            headers["X-Profile-Id"] = profile_request_id
+            cleanup.add_task(profiler.prune)
+        timings.add("queue", result["queue_seconds"])
+        for stage, seconds in result["stages"].items():
+            timings.add(stage, seconds)
+
+        # A filing Arelle could not convert is answered with what it logged about it
+        if not os.path.exists(json_output_path):
+            logger.warning(f"No JSON output for {key}, {report['errors']} error(s) logged")
+            return CodecJSONResponse(
+                content={"error": "XBRL conversion failed: JSON output file was not created after conversion",
+                         "validation": report},
+                status_code=422,
+                headers={"X-Result-Key": key, "X-Validation-Profile": validation,
+                         "X-Validation-Summary": summary_header(report)},
+                background=cleanup
             )
 
+        # Send the file Arelle wrote as-is, then fill the cache from it and clean up
+        if result_cache:
+            cleanup.tasks.insert(0, BackgroundTask(result_cache.put_file, key, json_output_path))
+        return FileResponse(json_output_path, media_type="application/json", headers=headers,
+                            background=cleanup)
+
+    except PoolBusy as e:
+        logger.warning(str(e))
+        return busy_response("All conversion workers are busy, please retry later", background=cleanup)
+
+    except WorkerTimeout as e:
+        logger.error(str(e))
+        return CodecJSONResponse(
+            content={"error": f"XBRL conversion failed: {str(e)}"},
+            status_code=504,
+            background=cleanup
+        )
+
+    except Exception as e:
+        logger.error(f"Error during conversion: {str(e)}")
+        return CodecJSONResponse(
+            content={"error": f"XBRL conversion failed: {str(e)}"},
+            status_code=500,
+            background=cleanup
+        )
+
+def _save_batch(files, directory):
+    """Save the uploads of a batch, unpacking archives of filings; returns the filing paths."""
+    paths = []
+    for file in files:
+        path = unique_path(directory, os.path.basename(file.filename or "filing"))
+        save_upload(file.file, path)
+        if is_filing_archive(path):
+            paths.extend(extract_filings(path, tempfile.mkdtemp(dir=directory)))
+            os.remove(path)
+        else:
+            paths.append(path)
+    return paths
+
+
+@app.post("/convert/batch")
+async def convert_batch(files: List[UploadFile] = File(...), validation: Optional[str] = Form(None)):
+    """
+    Convert several filings (or zips of filings) in one request, all with the same
+    validation profile. Results are streamed
+    back as JSON Lines in completion order, one {"file", "success", "seconds", "cache",
+    "validation", "json_data" | "error"} per filing, followed by a {"summary": ...} line.
+    """
+    global pending_conversions
+    workers = controller_pool.size
+    logger.debug(f"Batch endpoint called with {len(files)} upload(s)")
+    validation = validation or VALIDATION_PROFILE
+    if validation not in VALIDATION_PROFILES:
+        return unknown_validation_profile(validation)
+
+    # A batch keeps every pooled worker busy, so it takes that many admission slots
+    if pending_conversions + workers > controller_pool.size + MAX_QUEUE:
+        logger.warning(f"Rejecting batch, {pending_conversions} conversions already pending")
+        return busy_response("Conversion queue is full, please retry later")
+    pending_conversions += workers
+
+    temp_dir = tempfile.mkdtemp()
+    cleanup = BackgroundTasks()
+    cleanup.add_task(shutil.rmtree, temp_dir, ignore_errors=True)
+
+    def release():
+        global pending_conversions
+        pending_conversions -= workers
+    cleanup.add_task(release)
+
+    try:
+        input_dir = os.path.join(temp_dir, "inputs")
+        output_dir = os.path.join(temp_dir, "outputs")
+        os.makedirs(input_dir)
+        os.makedirs(output_dir)
+        paths = await run_in_threadpool(_save_batch, files, input_dir)
+    except Exception as e:
+        logger.error(f"Error while saving batch: {str(e)}")
+        return CodecJSONResponse(
+            content={"error": f"XBRL conversion failed: {str(e)}"},
+            status_code=500,
+            background=cleanup
+        )
+
+    def results():
+        # A plain generator: StreamingResponse iterates it in the threadpool
+        records = []
+        started = time.perf_counter()
+        for record in convert_many(controller_pool, paths, output_dir, workers,
+                                   result_cache=result_cache, validation_reports=validation_reports,
+                                   options=CONVERSION_OPTIONS + conversion_options(validation),
+                                   extra_args=validation_args(validation), timeout=QUEUE_WAIT_SECONDS):
+            records.append(record)
+            observe(record.get("stages", {}))
+            yield json_line(record, record["output"] if record["success"] else None)
+            if record["success"]:
+                os.remove(record["output"])
+        summary = summarize(records, time.perf_counter() - started)
+        logger.info(f"Batch of {summary['files']} converted at {summary['files_per_second']:.2f} files/s")
+        yield json_codec.dumps({"summary": summary}) + b'\n'
+
+    return StreamingResponse(results(), media_type="application/x-ndjson", background=cleanup)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
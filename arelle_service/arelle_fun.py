@@ -18,8 +18,11 @@ from arelle.BetaFeatures import BETA_OBJECT_MODEL_FEATURE, enableNewObjectModel
 from arelle import CntlrCmdLine, CntlrComServer
 
 
-def convert(args):
-    logger.debug("convert() called")
+def apply_global_options(args):
+    """
+    Apply the process-wide Arelle switches that have to be set before a controller is
+    created: the offline socket guard and the beta object model.
+    """
     internetConnectivityArgPattern = rf'--({INTERNET_CONNECTIVITY}|{INTERNET_CONNECTIVITY.lower()})'
     internetConnectivityArgRegex = re.compile(internetConnectivityArgPattern)
     internetConnectivityOfflineEqualsRegex = re.compile(f"{internetConnectivityArgPattern}={OFFLINE}")
@@ -37,6 +40,11 @@ def convert(args):
         logger.debug("Enabling new object model")
         enableNewObjectModel()
 
+
+def convert(args):
+    logger.debug("convert() called")
+    apply_global_options(args)
+
     if '--COMserver' in args:
         logger.debug("Turning on com server")
         CntlrComServer.main()
@@ -0,0 +1,596 @@
+import copy
+import functools
+import gettext
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from arelle import CntlrCmdLine, FileSource
+
+from arelle_fun import apply_global_options
+from profiling import profiled
+from validation_log import MessageCapture, message_capture_from_env
+
+logger = logging.getLogger("uvicorn.error")
+logger.setLevel(logging.DEBUG)
+
+# Conversion profiles: the plugins a conversion needs and the validation options it runs
+# with. Plugins are loaded once per controller and stay registered with the PluginManager
+# for every job it runs afterwards, so a worker loads those of every profile it serves.
+VALIDATION_PROFILES = {
+    # xBRL-JSON output only, no validation
+    "none": {"plugins": ("saveLoadableOIM",), "args": ()},
+    # XBRL 2.1 and dimensional validation, without calculations or formulas
+    "xbrl21": {"plugins": ("saveLoadableOIM",), "args": ("-v", "--formula=none")},
+    # What applies to ESRS filings: XBRL 2.1, Calculations 1.1, the UTR and the taxonomy's formulas
+    "esrs": {"plugins": ("saveLoadableOIM",), "args": ("-v", "--calc=c11r", "--utr", "--formula=run")},
+    # All of the above plus the SEC EDGAR Filer Manual rules
+    "full": {"plugins": ("validate/EFM", "saveLoadableOIM"),
+             "args": ("-v", "--calc=c11r", "--utr", "--formula=run", "--disclosureSystem=efm-pragmatic")},
+}
+
+DEFAULT_VALIDATION_PROFILE = "none"
+
+# Taxonomy entry point seed_taxonomy_cache.py loads at image build time, so its DTS files are
+# in the web cache before the first filing arrives. Workers load none unless
+# ARELLE_WARM_ENTRYPOINTS names some: the model is closed afterwards, so a load at worker
+# start only costs time and CPU when the cache is already seeded.
+ESRS_ENTRYPOINT = 'https://xbrl.efrag.org/taxonomy/esrs/2023-12-22/esrs_all.xsd'
+
+# Placeholders used to parse an argument template once; the real paths are filled in per job.
+_ENTRYPOINT_PLACEHOLDER = '__entrypoint__'
+_OIM_PLACEHOLDER = '__oim_output__'
+
+
+class PoolBusy(Exception):
+    """No worker became free within the allowed queueing time."""
+
+
+class WorkerTimeout(Exception):
+    """A conversion exceeded the per-job timeout and its worker process was killed."""
+
+
+def plugins_for(profiles):
+    """The '|' separated plugins a controller serving every one of `profiles` loads."""
+    plugins = []
+    for profile in profiles:
+        plugins.extend(plugin for plugin in VALIDATION_PROFILES[profile]["plugins"] if plugin not in plugins)
+    return '|'.join(plugins)
+
+
+def validation_args(profile):
+    """Arelle options of a validation profile, the `extra_args` of a conversion."""
+    return VALIDATION_PROFILES[profile]["args"]
+
+
+def conversion_options(profile):
+    """What a validation profile contributes to the result cache key."""
+    return [profile, *VALIDATION_PROFILES[profile]["plugins"], *VALIDATION_PROFILES[profile]["args"]]
+
+
+DEFAULT_PLUGINS = plugins_for((DEFAULT_VALIDATION_PROFILE,))
+
+
+def profile_stages(profile_stats):
+    """
+    Seconds per stage of one run from a model's profileStats ({name: (order, seconds,
+    memory)}, collected with --collectProfileStats): "load" (DTS and instance), "validate"
+    (every validation and formula stat) and "save_oim", the rest of the run, where the
+    saveLoadableOIM plugin writes the JSON.
+    """
+    stages = {"load": 0.0, "validate": 0.0}
+    for name, (_, seconds, _) in profile_stats.items():
+        if name in ("load", "import"):
+            stages["load"] += seconds
+        elif name != "total":
+            stages["validate"] += seconds
+    total = profile_stats.get("total", (0, 0.0, 0))[1]
+    stages["save_oim"] = max(0.0, total - stages["load"] - stages["validate"])
+    return stages
+
+
+def current_rss_bytes():
+    """Resident set size of this process, falling back to the peak RSS where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ArelleWorker:
+    """
+    A warmed, long-lived Arelle command line controller.
+
+    The controller and its plugins are set up once in warm_up(); run() then only copies a
+    pre-parsed option template, fills in the paths of the current job and calls
+    CntlrCmdLine.run(), the same way Arelle's own web server reuses a controller.
+    """
+
+    def __init__(self, plugins=DEFAULT_PLUGINS, base_args=(), warm_entrypoints=(), extra_args_variants=((),),
+                 message_capture=None):
+        self.plugins = plugins
+        self.base_args = tuple(base_args)
+        self.warm_entrypoints = tuple(warm_entrypoints)
+        self.extra_args_variants = tuple(tuple(extra_args) for extra_args in extra_args_variants)
+        self.message_capture = message_capture or {}
+        self.taxonomy_failures = []
+        self.cntlr = None
+        self.templates = {}
+        self.jobs = 0
+        self.warmup_seconds = None
+        self.last_job_seconds = None
+        self.total_job_seconds = 0.0
+
+    def _template_args(self, extra_args):
+        return [
+            '-f', _ENTRYPOINT_PLACEHOLDER,
+            '--plugins', self.plugins,
+            f'--saveLoadableOIM={_OIM_PLACEHOLDER}',
+            # Keep the model open after the run so its profile stats can be read, see run()
+            '--collectProfileStats',
+            '--keepOpen',
+            *self.base_args,
+            *extra_args,
+        ]
+
+    def warm_up(self, extra_args_variants=None, load_taxonomies=True):
+        """
+        Parse the option templates (one per `extra_args_variants` entry, by default the
+        worker's own) and create the controller with its plugins preloaded, then load the
+        warm entry points unless `load_taxonomies` is false.
+        All templates are parsed before the controller exists because parseArgs() builds a
+        throwaway controller that would otherwise replace ours inside the PluginManager.
+        """
+        extra_args_variants = extra_args_variants or self.extra_args_variants
+        started_at = time.perf_counter()
+        self.close()
+        CntlrCmdLine.setApplicationLocale()
+        gettext.install("arelle")
+
+        plugin_modules = {}
+        for extra_args in extra_args_variants:
+            args = self._template_args(extra_args)
+            apply_global_options(args)
+            runtime_options, modules = CntlrCmdLine.parseArgs(args)
+            self.templates[tuple(extra_args)] = runtime_options
+            plugin_modules.update(modules)
+
+        self.cntlr = CntlrCmdLine.createCntlrAndPreloadPlugins(None, False, plugin_modules)
+        self.cntlr.startLogging(logFileName="logToPrint",
+                                logFormat="[%(messageCode)s] %(message)s - %(file)s",
+                                logLevel="DEBUG")
+        self.cntlr.postLoggingInit()
+
+        # Run one template without an entry point: that applies the web cache directory,
+        # internet connectivity and taxonomy package mappings to the controller. Packages
+        # stay mapped afterwards, so they are dropped from the job templates.
+        settings = copy.copy(next(iter(self.templates.values())))
+        settings.entrypointFile = None
+        self.cntlr.run(settings)
+        for template in self.templates.values():
+            template.packages = None
+
+        if load_taxonomies:
+            self.taxonomy_failures = [url for url in self.warm_entrypoints if not self._load_taxonomy(url)]
+
+        self.warmup_seconds = time.perf_counter() - started_at
+        logger.info(f"Arelle worker warmed up in {self.warmup_seconds:.3f}s (plugins: {self.plugins})")
+
+    def _load_taxonomy(self, url):
+        """Load and discard one taxonomy entry point, filling the web cache with its DTS."""
+        started_at = time.perf_counter()
+        model_xbrl = self.cntlr.modelManager.load(FileSource.openFileSource(url, self.cntlr))
+        try:
+            loaded = model_xbrl is not None and model_xbrl.modelDocument is not None
+            if loaded:
+                logger.info(f"Loaded taxonomy {url} ({len(model_xbrl.urlDocs)} documents) "
+                            f"in {time.perf_counter() - started_at:.3f}s")
+            else:
+                logger.warning(f"Could not load taxonomy {url}")
+            return loaded
+        finally:
+            if model_xbrl is not None:
+                self.cntlr.modelManager.close(model_xbrl)
+
+    def _options_for(self, entrypoint_file, oim_output_file, extra_args):
+        key = tuple(extra_args)
+        if key not in self.templates:
+            # An option set we have not seen: parse it and rebuild the controller around it.
+            # The web cache already holds the warm entry points, so they are not loaded again.
+            self.warm_up(tuple(self.templates) + (key,), load_taxonomies=False)
+        options = copy.copy(self.templates[key])
+        options.entrypointFile = entrypoint_file
+        options.saveLoadableOIM = oim_output_file
+        return options
+
+    def run(self, entrypoint_file, oim_output_file, extra_args=(), profile=None):
+        """
+        Convert one filing and return the timing of the job and, as "validation", the
+        messages Arelle logged during it (see MessageCapture.report()). With `profile` (the
+        keyword arguments of profiling.profiled()), the Arelle run is profiled.
+        """
+        if self.cntlr is None:
+            self.warm_up()
+        options = self._options_for(entrypoint_file, oim_output_file, extra_args)
+
+        capture = MessageCapture(**self.message_capture)
+        self.cntlr.logger.addHandler(capture)
+        started_at = time.perf_counter()
+        success = False
+        try:
+            with profiled(**profile) if profile else nullcontext():
+                success = self.cntlr.run(options)
+        finally:
+            stages = self._close_models()
+            self.cntlr.logger.removeHandler(capture)
+        elapsed = time.perf_counter() - started_at
+
+        self.jobs += 1
+        self.last_job_seconds = elapsed
+        self.total_job_seconds += elapsed
+        logger.info(f"Arelle job {self.jobs} finished in {elapsed:.3f}s (success={success})")
+        return {"success": success, "seconds": elapsed, "stages": stages, "validation": capture.report(success)}
+
+    def _close_models(self):
+        """Read the stage timings of the model --keepOpen left open, then close it."""
+        manager = self.cntlr.modelManager
+        stages = profile_stages(manager.modelXbrl.profileStats) if manager.modelXbrl is not None else {}
+        while manager.modelXbrl is not None:
+            manager.close()
+        return stages
+
+    @property
+    def pid(self):
+        return os.getpid()
+
+    def rss_bytes(self):
+        return current_rss_bytes()
+
+    def is_alive(self):
+        return True
+
+    def close(self):
+        if self.cntlr is not None:
+            self.cntlr.modelManager.close()
+            # The "arelle" logger outlives the controller; a rebuilt one adds its own handler
+            if getattr(self.cntlr, "logHandler", None) is not None:
+                self.cntlr.logger.removeHandler(self.cntlr.logHandler)
+            self.cntlr = None
+
+
+def _process_worker_main(conn, plugins, base_args, warm_entrypoints, extra_args_variants, message_capture):
+    """Entry point of a spawned worker process: warm one ArelleWorker and serve jobs from the pipe."""
+    worker = ArelleWorker(plugins, base_args, warm_entrypoints, extra_args_variants, message_capture)
+    worker.warm_up()
+    conn.send(("ready", worker.warmup_seconds, worker.rss_bytes()))
+    while True:
+        message = conn.recv()
+        if message[0] == "stop":
+            break
+        _, entrypoint_file, oim_output_file, extra_args, profile = message
+        try:
+            result = worker.run(entrypoint_file, oim_output_file, extra_args, profile)
+            conn.send(("done", result, worker.rss_bytes()))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", worker.rss_bytes()))
+    worker.close()
+
+
+class ProcessWorker:
+    """
+    An ArelleWorker hosted in its own spawned process.
+
+    Every job's arguments travel over a private pipe, so no two conversions share Arelle's
+    process-global state or the ARELLE_ARGS environment variable. A job that runs longer
+    than `job_timeout` seconds gets its process killed.
+    """
+
+    def __init__(self, plugins=DEFAULT_PLUGINS, base_args=(), warm_entrypoints=(), extra_args_variants=((),),
+                 message_capture=None, job_timeout=None, warmup_timeout=300):
+        self.plugins = plugins
+        self.base_args = tuple(base_args)
+        self.warm_entrypoints = tuple(warm_entrypoints)
+        self.extra_args_variants = tuple(tuple(extra_args) for extra_args in extra_args_variants)
+        self.message_capture = message_capture or {}
+        self.job_timeout = job_timeout
+        self.warmup_timeout = warmup_timeout
+        self.process = None
+        self.conn = None
+        self.jobs = 0
+        self.warmup_seconds = None
+        self._rss = 0
+
+    def warm_up(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_process_worker_main,
+                                       args=(child_conn, self.plugins, self.base_args, self.warm_entrypoints,
+                                             self.extra_args_variants, self.message_capture),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        if not self.conn.poll(self.warmup_timeout):
+            self.kill()
+            raise WorkerTimeout(f"Arelle worker did not warm up within {self.warmup_timeout}s")
+        _, self.warmup_seconds, self._rss = self.conn.recv()
+        logger.info(f"Arelle worker process {self.process.pid} ready after {self.warmup_seconds:.3f}s")
+
+    def run(self, entrypoint_file, oim_output_file, extra_args=(), profile=None):
+        self.conn.send(("run", entrypoint_file, oim_output_file, tuple(extra_args), profile))
+        if not self.conn.poll(self.job_timeout):
+            logger.error(f"Arelle job exceeded {self.job_timeout}s, killing worker process {self.process.pid}")
+            self.kill()
+            raise WorkerTimeout(f"Conversion exceeded the {self.job_timeout}s time limit")
+        try:
+            status, payload, self._rss = self.conn.recv()
+        except EOFError:
+            self.kill()
+            raise RuntimeError("Arelle worker process exited during conversion")
+        self.jobs += 1
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def rss_bytes(self):
+        return self._rss
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.process = None
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self.conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=10)
+        self.kill()
+
+
+class ControllerPool:
+    """
+    A fixed-size pool of warmed Arelle workers.
+
+    Callers borrow a worker for one conversion and hand it back afterwards. A worker is
+    recycled (closed and replaced by a freshly warmed one) once it has run `max_jobs` jobs
+    or the process RSS exceeds `max_rss_bytes`.
+
+    Arelle keeps plugin and locale state in module globals, so in-process ArelleWorkers
+    are only safe when conversions are not run concurrently; ProcessWorkers each own a
+    process and can be borrowed from several threads at once.
+    """
+
+    def __init__(self, size=1, max_jobs=50, max_rss_bytes=None, worker_factory=ArelleWorker):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.worker_factory = worker_factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._recycled = 0
+        self._warmup_seconds = []
+        self._job_seconds = []
+
+    def _new_worker(self):
+        worker = self.worker_factory()
+        worker.warm_up()
+        with self._lock:
+            self._warmup_seconds.append(worker.warmup_seconds)
+            self._workers.append(worker)
+        return worker
+
+    def start(self):
+        for _ in range(self.size):
+            self._idle.put(self._new_worker())
+        logger.info(f"Arelle controller pool started with {self.size} worker(s)")
+
+    def _needs_recycling(self, worker):
+        if not worker.is_alive():
+            return True
+        if self.max_jobs and worker.jobs >= self.max_jobs:
+            logger.info(f"Recycling Arelle worker after {worker.jobs} jobs")
+            return True
+        if self.max_rss_bytes:
+            rss = worker.rss_bytes()
+            if rss > self.max_rss_bytes:
+                logger.info(f"Recycling Arelle worker at {rss / 2**20:.0f} MiB RSS")
+                return True
+        return False
+
+    def _replace(self, worker):
+        worker.close()
+        with self._lock:
+            self._recycled += 1
+            self._workers.remove(worker)
+        try:
+            self._idle.put(self._new_worker())
+        except Exception as e:
+            logger.error(f"Could not start a replacement Arelle worker: {e}")
+            with self._lock:
+                self.size -= 1
+
+    def _release(self, worker):
+        if self._needs_recycling(worker):
+            # Warm the replacement in the background so the caller is not charged for it
+            threading.Thread(target=self._replace, args=(worker,), daemon=True).start()
+        else:
+            self._idle.put(worker)
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        """Borrow an idle worker, waiting up to `timeout` seconds (PoolBusy if none frees up)."""
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolBusy(f"No Arelle worker became free within {timeout}s")
+        try:
+            yield worker
+        finally:
+            self._release(worker)
+
+    def run(self, entrypoint_file, oim_output_file, extra_args=(), timeout=None, profile=None):
+        """
+        Convert one filing on a borrowed worker, profiled inside the worker if `profile` is
+        given. Returns {"success", "seconds", "stages", "validation", "queue_seconds"}, the
+        last being the time spent waiting for a free worker.
+        """
+        started_at = time.perf_counter()
+        with self.borrow(timeout=timeout) as worker:
+            queue_seconds = time.perf_counter() - started_at
+            result = worker.run(entrypoint_file, oim_output_file, extra_args, profile)
+        result["queue_seconds"] = queue_seconds
+        with self._lock:
+            self._job_seconds.append(result["seconds"])
+            del self._job_seconds[:-1000]
+        return result
+
+    def stats(self):
+        with self._lock:
+            job_seconds = sorted(self._job_seconds)
+            warmup_seconds = list(self._warmup_seconds)
+            recycled = self._recycled
+
+        def percentile(p):
+            if not job_seconds:
+                return None
+            return job_seconds[min(len(job_seconds) - 1, int(p * len(job_seconds)))]
+
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "busy": self.busy(),
+            "recycled": recycled,
+            "warmup_seconds": {
+                "count": len(warmup_seconds),
+                "last": warmup_seconds[-1] if warmup_seconds else None,
+                "mean": sum(warmup_seconds) / len(warmup_seconds) if warmup_seconds else None,
+            },
+            "job_seconds": {
+                "count": len(job_seconds),
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": job_seconds[-1] if job_seconds else None,
+            },
+        }
+
+    def busy(self):
+        """Workers currently running a conversion."""
+        with self._lock:
+            return max(0, len(self._workers) - self._idle.qsize())
+
+    def worker_rss_bytes(self):
+        """{worker pid: RSS} as last reported by every worker."""
+        with self._lock:
+            workers = list(self._workers)
+        return {worker.pid: worker.rss_bytes() for worker in workers if worker.pid is not None}
+
+    def close(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+            with self._lock:
+                if worker in self._workers:
+                    self._workers.remove(worker)
+
+
+def base_args_from_env():
+    """
+    Arelle options shared by every job, taken from the environment:
+
+    ARELLE_CACHE_DIR            web/taxonomy cache directory (e.g. one pre-seeded into the image)
+    ARELLE_TAXONOMY_PACKAGES    '|' separated taxonomy package zips to map remote URLs to
+    ARELLE_OFFLINE=true         never go to the network, resolve everything from cache/packages
+    """
+    args = []
+    cache_dir = os.getenv('ARELLE_CACHE_DIR')
+    if cache_dir:
+        args.append(f'--cacheDirectory={cache_dir}')
+    packages = os.getenv('ARELLE_TAXONOMY_PACKAGES')
+    if packages:
+        args.append(f'--packages={packages}')
+    if os.getenv('ARELLE_OFFLINE', 'false').lower() in ('1', 'true', 'yes'):
+        args.append('--internetConnectivity=offline')
+    return args
+
+
+def warm_entrypoints_from_env(default=''):
+    """Entry points from ARELLE_WARM_ENTRYPOINTS ('|' separated), `default` when it is unset."""
+    return [url for url in os.getenv('ARELLE_WARM_ENTRYPOINTS', default).split('|') if url]
+
+
+def validation_profile_from_env():
+    """The profile conversions run with unless a request asks for another, ARELLE_VALIDATION_PROFILE."""
+    profile = os.getenv('ARELLE_VALIDATION_PROFILE', DEFAULT_VALIDATION_PROFILE)
+    if profile not in VALIDATION_PROFILES:
+        raise ValueError(f"ARELLE_VALIDATION_PROFILE must be one of {', '.join(VALIDATION_PROFILES)}, "
+                         f"not {profile!r}")
+    return profile
+
+
+def validation_profiles_from_env():
+    """
+    Profiles a request may choose, ARELLE_VALIDATION_PROFILES ('|' separated), always
+    including the default one. Workers load the plugins of all of them, so allowing "full"
+    puts the EFM plugin into every conversion's process.
+    """
+    default = validation_profile_from_env()
+    profiles = [default]
+    for profile in os.getenv('ARELLE_VALIDATION_PROFILES', '').split('|'):
+        profile = profile.strip()
+        if not profile or profile in profiles:
+            continue
+        if profile not in VALIDATION_PROFILES:
+            raise ValueError(f"Unknown validation profile {profile!r} in ARELLE_VALIDATION_PROFILES")
+        profiles.append(profile)
+    return tuple(profiles)
+
+
+def pool_from_env(size=None, profiles=None):
+    """
+    Build a ControllerPool configured from ARELLE_* environment variables; `size`
+    overrides ARELLE_POOL_SIZE. Workers load the plugins and warm the option templates of
+    every allowed validation profile, or of `profiles` when given.
+
+    ARELLE_WORKER_MODE=process (the default) runs every worker in its own spawned process;
+    ARELLE_WORKER_MODE=inline keeps the controllers in the service process.
+    """
+    max_rss_mb = int(os.getenv('ARELLE_MAX_WORKER_RSS_MB', '768'))
+    job_timeout = float(os.getenv('ARELLE_JOB_TIMEOUT', '300'))
+    profiles = profiles or validation_profiles_from_env()
+    worker_args = {
+        "plugins": plugins_for(profiles),
+        "base_args": base_args_from_env(),
+        "warm_entrypoints": warm_entrypoints_from_env(),
+        "extra_args_variants": tuple(validation_args(profile) for profile in profiles),
+        "message_capture": message_capture_from_env(),
+    }
+    if os.getenv('ARELLE_WORKER_MODE', 'process') == 'inline':
+        worker_factory = functools.partial(ArelleWorker, **worker_args)
+    else:
+        worker_factory = functools.partial(ProcessWorker, job_timeout=job_timeout or None, **worker_args)
+    return ControllerPool(
+        size=size or int(os.getenv('ARELLE_POOL_SIZE', '1')),
+        max_jobs=int(os.getenv('ARELLE_MAX_JOBS_PER_WORKER', '50')),
+        max_rss_bytes=max_rss_mb * 2**20 if max_rss_mb else None,
+        worker_factory=worker_factory,
+    )
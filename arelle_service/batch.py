@@ -0,0 +1,292 @@
+"""
+Convert many filings in one go.
+
+The same helpers back the /convert/batch endpoint and the command line:
+
+    python batch.py filings/ --output-dir converted/ --workers 4
+    python batch.py filings/ --jsonl results.jsonl --enrich
+    python batch.py filings/ --corpus corpus.sqlite
+
+Filings are pushed through a warmed ControllerPool in parallel, so taxonomy and plugin
+setup are paid once per worker rather than once per file. Each run ends with a throughput
+summary (files/s, p50/p95 seconds per file).
+"""
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import json_codec
+from result_cache import cache_key
+
+logger = logging.getLogger("uvicorn.error")
+
+# Files picked up from a directory or an uploaded archive of filings
+FILING_EXTENSIONS = ('.zip', '.xbrl', '.xml', '.xhtml', '.html', '.htm')
+
+# The ESRS enrichment lives with the backend; it is only available from a full checkout
+BACKEND_UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'utils')
+
+
+def find_filings(directory):
+    """Filings directly inside `directory`, sorted by name."""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(FILING_EXTENSIONS) and os.path.isfile(os.path.join(directory, name))
+    )
+
+
+def _archive_members(archive):
+    """Files of a zip, leaving out directories and the __MACOSX / dot files archivers add."""
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+        and not os.path.basename(info.filename).startswith('.')
+    ]
+
+
+def is_filing_archive(path):
+    """
+    True when `path` is a zip of filings: every file in it is itself a zip (a report
+    package or a zipped filing). Any other zip, such as an instance with its linkbases,
+    is one filing and converted as a whole.
+    """
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as archive:
+        members = _archive_members(archive)
+    return bool(members) and all(info.filename.lower().endswith('.zip') for info in members)
+
+
+def extract_filings(archive_path, directory):
+    """Extract the zipped filings of an archive of filings into `directory` and return their paths."""
+    paths = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in _archive_members(archive):
+            name = os.path.basename(info.filename)
+            if not name.lower().endswith('.zip'):
+                continue
+            path = unique_path(directory, name)
+            with archive.open(info) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target, 2**20)
+            paths.append(path)
+    return paths
+
+
+def unique_path(directory, name):
+    """`directory/name`, with a numeric suffix added if that file already exists."""
+    stem, ext = os.path.splitext(name)
+    path = os.path.join(directory, name)
+    counter = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}-{counter}{ext}")
+        counter += 1
+    return path
+
+
+def load_enricher():
+    """
+    Return a function that adds ESRS references to an OIM JSON file in place, using
+    backend/utils/fill_esrs.py and the ESRS snapshot next to it. Its `fingerprint` is
+    fill_esrs.esrs_fingerprint(), the enrichment the corpus store records.
+    """
+    sys.path.insert(0, os.path.abspath(BACKEND_UTILS_DIR))
+    import fill_esrs
+
+    snapshot = json_codec.read_json(os.path.join(fill_esrs.ESRS_DIRECTORY, 'esrs_json.json'))
+
+    def enrich(json_path):
+        report = json_codec.read_json(json_path)
+        fill_esrs.enhance_report_with_esrs_references(report, snapshot)
+        json_codec.write_json(json_path, report)
+
+    enrich.fingerprint = fill_esrs.esrs_fingerprint()
+    return enrich
+
+
+def load_corpus(path):
+    """The backend/utils/corpus_store.py corpus at `path`, created if missing."""
+    sys.path.insert(0, os.path.abspath(BACKEND_UTILS_DIR))
+    from corpus_store import CorpusStore
+
+    return CorpusStore(path)
+
+
+def convert_one(pool, path, output_path, result_cache=None, options=(), extra_args=(), enrich=None,
+                timeout=None, validation_reports=None):
+    """
+    Convert one filing to `output_path` with the Arelle options `extra_args`, answering from
+    `result_cache` when the same bytes were converted with the same options before. The
+    record's "validation" holds what Arelle logged during the conversion, kept in
+    `validation_reports` for cached answers. Returns a result record; failures are recorded
+    on it instead of raised.
+    """
+    started = time.perf_counter()
+    record = {"file": os.path.basename(path), "source": path, "output": output_path, "success": False,
+              "cache": "MISS"}
+    try:
+        key = None
+        if result_cache or validation_reports:
+            key = cache_key(file_sha256(path), options)
+        if result_cache:
+            compressed = result_cache.get_compressed(key)
+            if compressed is not None:
+                with open(output_path, 'wb') as f:
+                    f.write(gzip.decompress(compressed))
+                record["cache"] = "HIT"
+                if validation_reports:
+                    record["validation"] = validation_reports.get(key)
+        if record["cache"] == "MISS":
+            result = pool.run(path, output_path, extra_args, timeout=timeout)
+            record["stages"] = {"queue": result["queue_seconds"], **result.get("stages", {})}
+            record["validation"] = result["validation"]
+            if validation_reports:
+                validation_reports.put(key, result["validation"])
+            # convert_many() reserves the output name, so a failed conversion leaves it empty
+            if not os.path.exists(output_path) or not os.path.getsize(output_path):
+                raise Exception("JSON output file was not created after conversion")
+            if result_cache:
+                result_cache.put_file(key, output_path)
+        if enrich:
+            enrich(output_path)
+        record["success"] = True
+    except Exception as e:
+        logger.error(f"Conversion of {path} failed: {e}")
+        record["error"] = str(e)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    record["seconds"] = time.perf_counter() - started
+    return record
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(2**20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def convert_many(pool, paths, output_dir, workers, **convert_args):
+    """
+    Convert `paths` with up to `workers` conversions in flight and yield each result
+    record as soon as it finishes (not in input order). Outputs are written to
+    `output_dir` as <input name>.json.
+    """
+    outputs = {}
+    for path in paths:
+        outputs[path] = unique_path(output_dir, os.path.basename(path) + '.json')
+        open(outputs[path], 'wb').close()  # reserve the name
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(convert_one, pool, path, outputs[path], **convert_args) for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summarize(records, wall_seconds):
+    """Throughput summary of a finished batch."""
+    seconds = sorted(record["seconds"] for record in records)
+
+    def percentile(p):
+        if not seconds:
+            return None
+        return seconds[min(len(seconds) - 1, int(p * len(seconds)))]
+
+    return {
+        "files": len(records),
+        "succeeded": sum(1 for record in records if record["success"]),
+        "failed": sum(1 for record in records if not record["success"]),
+        "cache_hits": sum(1 for record in records if record["cache"] == "HIT"),
+        "wall_seconds": wall_seconds,
+        "files_per_second": len(records) / wall_seconds if wall_seconds else None,
+        "p50_seconds": percentile(0.50),
+        "p95_seconds": percentile(0.95),
+    }
+
+
+def json_line(record, json_path=None):
+    """
+    One JSON Lines entry for a result record. With `json_path`, the converted document is
+    spliced in as "json_data" without being parsed: valid JSON only has raw newlines as
+    whitespace, so dropping them keeps the document intact and on one line.
+    """
+    fields = {key: value for key, value in record.items() if key not in ("source", "output")}
+    line = json_codec.dumps(fields)
+    if json_path is None:
+        return line + b'\n'
+    with open(json_path, 'rb') as f:
+        document = f.read().replace(b'\r', b'').replace(b'\n', b'')
+    return line[:-1] + b', "json_data": ' + document + b'}\n'
+
+
+def main(argv=None):
+    from arelle_pool import (VALIDATION_PROFILES, conversion_options, pool_from_env, validation_args,
+                             validation_profile_from_env)
+
+    parser = argparse.ArgumentParser(description="Convert every XBRL filing in a directory to OIM JSON.")
+    parser.add_argument("input_dir", help="directory holding the filings (.zip, .xbrl, .xhtml, ...)")
+    parser.add_argument("--output-dir", help="write one <filing>.json per input here")
+    parser.add_argument("--jsonl", help="write one JSON Lines stream of results here ('-' for stdout)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('ARELLE_POOL_SIZE', '2')),
+                        help="conversions run in parallel (one warmed Arelle worker each)")
+    parser.add_argument("--enrich", action="store_true",
+                        help="add ESRS references using backend/utils/fill_esrs.py")
+    parser.add_argument("--corpus", help="also ingest every converted filing into this SQLite corpus")
+    parser.add_argument("--validation", choices=list(VALIDATION_PROFILES), default=validation_profile_from_env(),
+                        help="validation profile (default ARELLE_VALIDATION_PROFILE, else none)")
+    args = parser.parse_args(argv)
+    if not args.output_dir and not args.jsonl and not args.corpus:
+        parser.error("give --output-dir, --jsonl, --corpus or a combination")
+
+    paths = find_filings(args.input_dir)
+    if not paths:
+        parser.error(f"no filings found in {args.input_dir}")
+    enrich = load_enricher() if args.enrich else None
+    corpus = load_corpus(args.corpus) if args.corpus else None
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="arelle-batch-")
+    os.makedirs(output_dir, exist_ok=True)
+    jsonl = None
+    if args.jsonl:
+        jsonl = sys.stdout.buffer if args.jsonl == '-' else open(args.jsonl, 'wb')
+
+    pool = pool_from_env(size=args.workers, profiles=(args.validation,))
+    pool.start()
+    records = []
+    started = time.perf_counter()
+    try:
+        for record in convert_many(pool, paths, output_dir, args.workers, options=conversion_options(args.validation),
+                                   extra_args=validation_args(args.validation), enrich=enrich):
+            records.append(record)
+            logger.info(f"{record['file']}: {'ok' if record['success'] else 'failed'} in {record['seconds']:.2f}s")
+            if corpus and record["success"]:
+                record["corpus"] = corpus.ingest_file(record["output"], file_sha256(record["source"]),
+                                                      enrichment=enrich.fingerprint if enrich else None)
+            if jsonl:
+                jsonl.write(json_line(record, record["output"] if record["success"] else None))
+                jsonl.flush()
+            # convert_one() already removed the output of a failed conversion
+            if not args.output_dir and os.path.exists(record["output"]):
+                os.remove(record["output"])
+    finally:
+        pool.close()
+        if jsonl and jsonl is not sys.stdout.buffer:
+            jsonl.close()
+        if not args.output_dir:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    summary = summarize(records, time.perf_counter() - started)
+    print(json_codec.dumps(summary, indent=True).decode(), file=sys.stderr)
+    return 0 if not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Stage durations span cached answers (milliseconds) to large filings (minutes)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram("xbrl_stage_seconds", "Seconds spent per request stage", ["stage"],
+                          buckets=STAGE_BUCKETS)
+
+
+class RequestTimings:
+    """
+    Stage durations of one request. Every stage is observed in the xbrl_stage_seconds
+    histogram as it is added and reported in the response's Server-Timing header.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, seconds, observe=True):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if observe:
+            STAGE_SECONDS.labels(stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add_server_timing(self, header, prefix):
+        """
+        Copy the entries of an upstream Server-Timing header, renamed <prefix><name>. They
+        are not observed again here; the upstream service has its own histograms.
+        """
+        for entry in (header or '').split(','):
+            name, _, params = entry.strip().partition(';')
+            for param in params.split(';'):
+                key, _, value = param.strip().partition('=')
+                if name and key == 'dur':
+                    try:
+                        self.add(prefix + name, float(value) / 1000, observe=False)
+                    except ValueError:
+                        pass
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items())
+
+
+def observe(stages):
+    """Record {stage: seconds} measured outside of a request (e.g. per file of a batch)."""
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def request_timings(request):
+    """The RequestTimings TimingMiddleware attached to `request` (a fresh one without it)."""
+    return getattr(request.state, "timings", None) or RequestTimings()
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that gives every HTTP request a RequestTimings (request.state.timings),
+    times how long the request body takes to arrive ("receive") and the response to go out
+    ("send"), and adds the stages recorded so far as a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        scope.setdefault("state", {})["timings"] = timings
+        receive_started = None
+        send_started = None
+
+        async def timed_receive():
+            nonlocal receive_started
+            if receive_started is None:
+                receive_started = time.perf_counter()
+            message = await receive()
+            if (message["type"] == "http.request" and not message.get("more_body", False)
+                    and "receive" not in timings.stages):
+                timings.add("receive", time.perf_counter() - receive_started)
+            return message
+
+        async def timed_send(message):
+            nonlocal send_started
+            if message["type"] == "http.response.start":
+                send_started = time.perf_counter()
+                headers = [(name, value) for name, value in message.get("headers", [])
+                           if name.lower() != b"server-timing"]
+                upstream = [value for name, value in message.get("headers", []) if name.lower() == b"server-timing"]
+                server_timing = ", ".join([value.decode('latin-1') for value in upstream]
+                                          + ([timings.server_timing()] if timings.stages else []))
+                if server_timing:
+                    headers.append((b"server-timing", server_timing.encode('latin-1')))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False) and send_started:
+                timings.add("send", time.perf_counter() - send_started)
+                send_started = None
+            await send(message)
+
+        await self.app(scope, timed_receive, timed_send)
+
+
+def _family(family, name, documentation, value, label):
+    if isinstance(value, dict):
+        metric = family(name, documentation, labels=[label])
+        for label_value, number in value.items():
+            metric.add_metric([str(label_value)], number)
+        return metric
+    return family(name, documentation, value=value)
+
+
+def gauge(name, documentation, value, label=None):
+    """A gauge read at scrape time; `value` is a number or a {label value: number} dict."""
+    return _family(GaugeMetricFamily, name, documentation, value, label)
+
+
+def counter(name, documentation, value, label=None):
+    """A counter read at scrape time from a running total kept elsewhere."""
+    return _family(CounterMetricFamily, name, documentation, value, label)
+
+
+class CallbackCollector:
+    """Collector yielding the gauge() / counter() families `callback` returns at scrape time."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def collect(self):
+        yield from self.callback()
+
+
+def register_callback(callback):
+    REGISTRY.register(CallbackCollector(callback))
+
+
+def metrics_response_body():
+    """(body, content type) of the Prometheus exposition of every registered metric."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
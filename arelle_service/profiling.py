@@ -0,0 +1,316 @@
+import collections
+import cProfile
+import os
+import pstats
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+import json_codec
+
+# Request headers asking for a profile and naming the request it is stored under
+PROFILE_HEADER = "X-Profile"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+ENGINES = ("cprofile", "sampling")
+
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+# tracemalloc is process wide: started by the first profile in flight, stopped by the last
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def request_id_from(header=None):
+    """The client's X-Request-ID when it is a safe file name, a fresh random id otherwise."""
+    if header and _REQUEST_ID.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def _start_tracing(frames):
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        tracemalloc.reset_peak()
+        _tracing_users += 1
+
+
+def _stop_tracing(top):
+    """Top allocations still held, the traced peak, and tracemalloc stopped if no one else uses it."""
+    global _tracing_users
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    peak = tracemalloc.get_traced_memory()[1]
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+    allocations = [
+        {
+            "location": f"{stat.traceback[-1].filename}:{stat.traceback[-1].lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count,
+            # Most recent frame first, as in a traceback.format(most_recent_first=True)
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)],
+        }
+        for stat in snapshot.statistics("traceback")[:top]
+    ]
+    return allocations, peak
+
+
+def _function_name(filename, line, name):
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class StackSampler:
+    """
+    Statistical profiler: a daemon thread records the stack of thread `thread_id` every
+    `interval` seconds, leaving out the `root_depth` outermost frames. The samples come out
+    as folded stacks ("root;...;leaf count"), the input of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=0.005, root_depth=0):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_depth = root_depth
+        self.stacks = collections.Counter()
+        self.seconds = 0.0
+        self._started = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(_function_name(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            stack = stack[::-1][self.root_depth:]
+            if stack:
+                self.stacks[";".join(stack)] += 1
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self._started
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, top):
+        # Samples are missed while the sampled thread holds the GIL, so a sample stands for
+        # the observed time per sample rather than for `interval`
+        samples = sum(self.stacks.values())
+        per_sample = self.seconds / samples if samples else self.interval
+        own, cumulative = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                cumulative[name] += count
+        return [
+            {
+                "function": name,
+                "samples": count,
+                "own_seconds": own[name] * per_sample,
+                "cumulative_seconds": count * per_sample,
+            }
+            for name, count in cumulative.most_common(top)
+        ]
+
+
+def _cprofile_top_functions(profile, top):
+    stats = pstats.Stats(profile).stats
+    ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return [
+        {
+            "function": _function_name(*key),
+            "calls": calls,
+            "own_seconds": own_seconds,
+            "cumulative_seconds": cumulative_seconds,
+        }
+        for key, (_, calls, own_seconds, cumulative_seconds, _) in ranked
+    ]
+
+
+@contextmanager
+def profiled(directory, label, engine="cprofile", interval=0.005, tracemalloc_frames=10, top=25):
+    """
+    Profile the block in the calling thread and write the result to `directory`:
+    <label>.prof (cProfile, for snakeviz / pstats) or <label>.folded (sampling, for a
+    flamegraph), and <label>.json, a summary with the slowest functions and the `top`
+    allocations still held at the end of the block. tracemalloc traces the whole process,
+    so allocations of other threads running at the same time are included.
+    """
+    os.makedirs(directory, exist_ok=True)
+    _start_tracing(tracemalloc_frames)
+    if engine == "sampling":
+        # Stacks start at the frame running the with block (the caller of contextlib's __enter__)
+        root_depth, frame = -1, sys._getframe(2)
+        while frame is not None:
+            root_depth, frame = root_depth + 1, frame.f_back
+        profiler = StackSampler(threading.get_ident(), interval, root_depth)
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        if engine == "sampling":
+            profiler.stop()
+            with open(os.path.join(directory, f"{label}.folded"), 'w', encoding='utf-8') as f:
+                f.write(profiler.folded())
+            functions = profiler.top_functions(top)
+        else:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(directory, f"{label}.prof"))
+            functions = _cprofile_top_functions(profiler, top)
+        allocations, peak = _stop_tracing(top)
+        with open(os.path.join(directory, f"{label}.json"), 'wb') as f:
+            f.write(json_codec.dumps({
+                "label": label,
+                "engine": engine,
+                "created": time.time(),
+                "seconds": seconds,
+                "traced_peak_bytes": peak,
+                "top_functions": functions,
+                "top_allocations": allocations,
+            }, indent=True))
+
+
+def profiled_call(profile, function, *args):
+    """function(*args), profiled with the profiled() keyword arguments `profile` unless it is None."""
+    if profile is None:
+        return function(*args)
+    with profiled(**profile):
+        return function(*args)
+
+
+class Profiler:
+    """
+    Decides which requests are profiled and keeps their profiles, one directory per
+    request ID under `directory`, pruned to the `keep` most recent.
+
+    A request is profiled when it sends `X-Profile: 1` and `header_enabled` is set, or
+    when it is drawn at `sample_rate`. options() gives the keyword arguments of profiled()
+    for one request; they are plain values, so they can be sent to a worker process.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, header_enabled=False, engine="cprofile",
+                 interval=0.005, tracemalloc_frames=10, top=25, keep=100):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header_enabled = header_enabled
+        self.engine = engine
+        self.interval = interval
+        self.tracemalloc_frames = tracemalloc_frames
+        self.top = top
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def wanted(self, header=None):
+        if self.header_enabled and header and header.strip().lower() in ("1", "true", "yes"):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def options(self, request_id, label):
+        return {
+            "directory": os.path.join(self.directory, request_id),
+            "label": label,
+            "engine": self.engine,
+            "interval": self.interval,
+            "tracemalloc_frames": self.tracemalloc_frames,
+            "top": self.top,
+        }
+
+    def _directory_of(self, request_id):
+        if not _REQUEST_ID.match(request_id):
+            return None
+        directory = os.path.join(self.directory, request_id)
+        return directory if os.path.isdir(directory) else None
+
+    def profiles(self):
+        """Stored profiles, newest first: [{"request_id", "created", "files"}]."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                entries.append({
+                    "request_id": entry.name,
+                    "created": entry.stat().st_mtime,
+                    "files": sorted(os.listdir(entry.path)),
+                })
+        return sorted(entries, key=lambda entry: entry["created"], reverse=True)
+
+    def summaries(self, request_id):
+        """{label: summary} of the profiles stored for `request_id`, or None if there are none."""
+        directory = self._directory_of(request_id)
+        if directory is None:
+            return None
+        return {
+            name[:-len(".json")]: json_codec.read_json(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory)) if name.endswith(".json")
+        }
+
+    def file(self, request_id, name):
+        """Path of one stored profile file, or None."""
+        directory = self._directory_of(request_id)
+        if directory is None or name not in os.listdir(directory):
+            return None
+        return os.path.join(directory, name)
+
+    def prune(self):
+        for entry in self.profiles()[self.keep:]:
+            shutil.rmtree(os.path.join(self.directory, entry["request_id"]), ignore_errors=True)
+
+
+def profiler_from_env():
+    """
+    The Profiler configured by PROFILE_* environment variables, or None when profiling is
+    off (the default), so nothing is checked or started per request:
+
+    PROFILE_SAMPLE_RATE       fraction of requests profiled unasked (0..1, default 0)
+    PROFILE_HEADER_ENABLED    honour `X-Profile: 1` request headers (default false)
+    PROFILE_ENGINE            cprofile (default) or sampling, which also gives a flamegraph
+    PROFILE_SAMPLE_INTERVAL   seconds between the sampling engine's stack samples
+    PROFILE_TRACEMALLOC_FRAMES  frames kept per traced allocation
+    PROFILE_TOP               functions and allocations listed in a summary
+    PROFILE_DIR               where profiles are stored
+    PROFILE_KEEP              profiles kept, the oldest are deleted first
+    """
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    header_enabled = os.getenv('PROFILE_HEADER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    if sample_rate <= 0 and not header_enabled:
+        return None
+    engine = os.getenv('PROFILE_ENGINE', 'cprofile')
+    if engine not in ENGINES:
+        raise ValueError(f"PROFILE_ENGINE must be one of {', '.join(ENGINES)}, not {engine!r}")
+    return Profiler(
+        directory=os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'xbrl-profiles')),
+        sample_rate=sample_rate,
+        header_enabled=header_enabled,
+        engine=engine,
+        interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005')),
+        tracemalloc_frames=int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', '10')),
+        top=int(os.getenv('PROFILE_TOP', '25')),
+        keep=int(os.getenv('PROFILE_KEEP', '100')),
+    )
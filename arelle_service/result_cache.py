@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def cache_key(content_sha256, options):
+    """Key of one conversion: the SHA-256 of the uploaded bytes plus the option set used."""
+    digest = hashlib.sha256(content_sha256.encode())
+    for option in options:
+        digest.update(b'\0')
+        digest.update(str(option).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed store of converted OIM JSON.
+
+    Entries are gzip-compressed files under `directory`, evicted least-recently-used once
+    their total size passes `max_bytes`. With `memory_max_bytes` set, the most recently
+    used compressed entries are also kept in memory. All methods do blocking I/O and are
+    meant to be called from a thread, not the event loop.
+    """
+
+    def __init__(self, directory, max_bytes, memory_max_bytes=0, compresslevel=6):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.compresslevel = compresslevel
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> compressed size, least recently used first
+        self._size = 0
+        self._memory = OrderedDict()  # key -> compressed bytes
+        self._memory_size = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json.gz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, name[:-len('.json.gz')], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+        logger.info(f"Result cache at {self.directory}: {len(self._entries)} entries, {self._size} bytes")
+
+    def _remember(self, key, compressed):
+        if not self.memory_max_bytes or len(compressed) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = compressed
+        self._memory_size += len(compressed)
+        while self._memory_size > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get_compressed(self, key):
+        """Return the gzip-compressed entry for `key`, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            compressed = self._memory.get(key)
+            if compressed is not None:
+                self._memory.move_to_end(key)
+                return compressed
+        try:
+            with open(self._path(key), 'rb') as f:
+                compressed = f.read()
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        with self._lock:
+            self._remember(key, compressed)
+        return compressed
+
+    def get(self, key):
+        """Return the decompressed JSON bytes for `key`, or None on a miss."""
+        compressed = self.get_compressed(key)
+        return gzip.decompress(compressed) if compressed is not None else None
+
+    def put(self, key, data):
+        """Store the JSON bytes `data` under `key`, evicting old entries beyond the size limit."""
+        compressed = gzip.compress(data, compresslevel=self.compresslevel)
+        if len(compressed) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(compressed)
+            self._size += len(compressed)
+            self._remember(key, compressed)
+            self._evict()
+
+    def put_file(self, key, path):
+        """
+        Like put(), but compresses the JSON file at `path` in chunks instead of from memory.
+        The compressed entry is read back into the memory tier when it fits there.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with open(path, 'rb') as source, os.fdopen(fd, 'wb') as raw, \
+                gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=self.compresslevel) as target:
+            shutil.copyfileobj(source, target, 2**20)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        compressed = None
+        if self.memory_max_bytes and size <= self.memory_max_bytes:
+            with open(tmp_path, 'rb') as f:
+                compressed = f.read()
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = size
+            self._size += size
+            if compressed is not None:
+                self._remember(key, compressed)
+            self._evict()
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._size -= size
+        compressed = self._memory.pop(key, None)
+        if compressed is not None:
+            self._memory_size -= len(compressed)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._forget(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def result_cache_from_env():
+    """
+    Build the ResultCache from ARELLE_RESULT_CACHE_* settings, or None when
+    ARELLE_RESULT_CACHE_MAX_MB is 0.
+    """
+    max_mb = int(os.getenv('ARELLE_RESULT_CACHE_MAX_MB', '512'))
+    if not max_mb:
+        return None
+    directory = os.getenv('ARELLE_RESULT_CACHE_DIR',
+                          os.path.join(tempfile.gettempdir(), 'arelle-result-cache'))
+    memory_mb = int(os.getenv('ARELLE_RESULT_CACHE_MEMORY_MB', '0'))
+    return ResultCache(directory, max_mb * 2**20, memory_mb * 2**20)
@@ -0,0 +1,40 @@
+"""
+Pre-seed Arelle's web/taxonomy cache so the service can run with ARELLE_OFFLINE=true.
+
+Loads every entry point in ARELLE_WARM_ENTRYPOINTS (the ESRS taxonomy by default) online
+and lets Arelle store each discovered schema and linkbase under ARELLE_CACHE_DIR. Run it
+at image build time:
+
+    ARELLE_CACHE_DIR=/app/taxonomy-cache python seed_taxonomy_cache.py
+"""
+import logging
+import os
+import sys
+
+from arelle_pool import ESRS_ENTRYPOINT, ArelleWorker, warm_entrypoints_from_env
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def seed(cache_dir, entrypoints):
+    os.makedirs(cache_dir, exist_ok=True)
+    worker = ArelleWorker(
+        base_args=[f'--cacheDirectory={cache_dir}', '--internetConnectivity=online'],
+        warm_entrypoints=entrypoints,
+    )
+    worker.warm_up()
+    worker.close()
+
+    cached_files = sum(len(files) for _, _, files in os.walk(cache_dir))
+    logger.info(f"Taxonomy cache at {cache_dir} holds {cached_files} files")
+    return worker.taxonomy_failures
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cache_dir = os.getenv('ARELLE_CACHE_DIR')
+    if not cache_dir:
+        sys.exit("ARELLE_CACHE_DIR must point to the cache directory to seed")
+    failures = seed(cache_dir, warm_entrypoints_from_env(default=ESRS_ENTRYPOINT))
+    if failures:
+        sys.exit(f"Could not load: {', '.join(failures)}")
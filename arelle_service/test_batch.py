@@ -0,0 +1,42 @@
+"""
+batch.main() over a mix of good and bad filings, with a stub pool in place of Arelle.
+
+    python -m pytest arelle_service/test_batch.py
+"""
+import json
+import os
+
+import arelle_pool
+import batch
+
+
+class StubPool:
+    """Writes a small OIM JSON for every filing except those named bad*, like a failed conversion."""
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, path, output_path, extra_args=(), timeout=None):
+        if not os.path.basename(path).startswith('bad'):
+            with open(output_path, 'wb') as f:
+                f.write(b'{"documentInfo": {}, "facts": {}}')
+        return {"queue_seconds": 0.0, "stages": {}, "validation": {"success": True, "total": 0}}
+
+
+def test_mixed_batch_to_jsonl(tmp_path, monkeypatch):
+    filings = tmp_path / "filings"
+    filings.mkdir()
+    for name in ("good-1.xbrl", "bad-1.xbrl", "good-2.xbrl", "bad-2.xbrl"):
+        (filings / name).write_bytes(b"<xbrl/>")
+    monkeypatch.setattr(arelle_pool, "pool_from_env", lambda **kwargs: StubPool())
+    jsonl = tmp_path / "results.jsonl"
+
+    assert batch.main([str(filings), "--jsonl", str(jsonl), "--workers", "2"]) == 1
+
+    records = {record["file"]: record for record in map(json.loads, jsonl.read_text().splitlines())}
+    assert sorted(records) == ["bad-1.xbrl", "bad-2.xbrl", "good-1.xbrl", "good-2.xbrl"]
+    assert records["good-1.xbrl"]["success"] and records["good-1.xbrl"]["json_data"] == {"documentInfo": {}, "facts": {}}
+    assert not records["bad-2.xbrl"]["success"] and "json_data" not in records["bad-2.xbrl"]
@@ -0,0 +1,83 @@
+import hashlib
+import json
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class MaxBodySizeMiddleware:
+    """
+    ASGI middleware that answers 413 as soon as a request body grows past `max_bytes`.
+
+    A Content-Length over the limit is refused before any of the body is read. Otherwise
+    the body is counted while it streams in; once it passes the limit, reading stops and
+    whatever response the app produces for the truncated upload is replaced by the 413.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send):
+        body = json.dumps({"error": f"Upload exceeds the maximum size of {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise ValueError("Request body exceeds the maximum upload size")
+            return message
+
+        rejected = False
+
+        async def limited_send(message):
+            nonlocal rejected
+            if exceeded:
+                if not rejected:
+                    rejected = True
+                    await self._reject(send)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except Exception:
+            if not exceeded:
+                raise
+            if not rejected:
+                await self._reject(send)
+
+
+def save_upload(source, path):
+    """Copy an uploaded file object to `path` in chunks and return the SHA-256 of its bytes."""
+    digest = hashlib.sha256()
+    source.seek(0)
+    with open(path, 'wb') as target:
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+            target.write(chunk)
+    return digest.hexdigest()
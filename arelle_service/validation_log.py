@@ -0,0 +1,186 @@
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import json_codec
+from result_cache import ResultCache
+
+# Levels Arelle registers in Cntlr.startLogging besides the standard ones
+ARELLE_LEVELS = {
+    "INFO-RESULT": logging.INFO - 1,
+    "INFO-SEMANTIC": logging.INFO + 1,
+    "WARNING-SEMANTIC": logging.WARNING + 1,
+    "ASSERTION-SATISFIED": logging.WARNING + 2,
+    "INCONSISTENCY": logging.WARNING + 3,
+    "ERROR-SEMANTIC": logging.ERROR - 2,
+    "ASSERTION-NOT-SATISFIED": logging.ERROR - 1,
+}
+
+# Levels counted as "errors" in a report: ERROR-SEMANTIC, ASSERTION-NOT-SATISFIED, ERROR and up
+ERROR_LEVEL = logging.ERROR - 2
+
+# Below ERROR_LEVEL but not a warning: the assertion held
+ASSERTION_SATISFIED = ARELLE_LEVELS["ASSERTION-SATISFIED"]
+
+# Fields of a report that are small enough for a response header
+SUMMARY_FIELDS = ("success", "total", "errors", "warnings", "truncated")
+
+
+def level_number(name):
+    """Numeric level of a standard or Arelle log level name (case-insensitive)."""
+    name = name.strip().upper()
+    if name in ARELLE_LEVELS:
+        return ARELLE_LEVELS[name]
+    level = logging.getLevelName(name)
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level {name!r}")
+    return level
+
+
+def level_name(levelno):
+    for name, number in ARELLE_LEVELS.items():
+        if number == levelno:
+            return name.lower()
+    return logging.getLevelName(levelno).lower()
+
+
+class MessageCapture(logging.Handler):
+    """
+    Collects what Arelle logs during one conversion as structured records.
+
+    Attached to the controller's "arelle" logger for the length of a run. emit() keeps the
+    first `max_messages` records as they are and only counts the rest, by level and by
+    message code; nothing is formatted until report(), which renders the kept records
+    once. A filing with thousands of inconsistencies costs a few counter increments per
+    message, and no log file is written.
+    """
+
+    def __init__(self, level=logging.WARNING, max_messages=200, max_refs=10, max_message_chars=1000,
+                 max_codes=100):
+        super().__init__(level)
+        self.max_messages = max_messages
+        self.max_refs = max_refs
+        self.max_message_chars = max_message_chars
+        self.max_codes = max_codes
+        self.records = []
+        self.levels = Counter()
+        self.codes = Counter()
+
+    def emit(self, record):
+        self.levels[record.levelno] += 1
+        self.codes[getattr(record, "messageCode", "") or ""] += 1
+        if len(self.records) < self.max_messages:
+            self.records.append(record)
+
+    def _text(self, record):
+        # Arelle messages are %(name)s templates with a dict of already dereferenced values
+        try:
+            text = record.msg % record.args if record.args else str(record.msg)
+        except (TypeError, ValueError, KeyError):
+            text = str(record.msg)
+        if len(text) > self.max_message_chars:
+            text = text[:self.max_message_chars] + "..."
+        return text
+
+    def _refs(self, record):
+        # Model objects (facts, contexts, arcs) are referenced by document href, line and object id
+        refs = []
+        for ref in getattr(record, "refs", None) or ():
+            entry = {"href": ref.get("href"), "line": ref.get("sourceLine"), "object_id": ref.get("objectId")}
+            refs.append({key: value for key, value in entry.items() if value is not None})
+            if len(refs) == self.max_refs:
+                break
+        return refs
+
+    def report(self, success=None):
+        """The captured messages as plain data, ready to be pickled, cached or sent as JSON."""
+        total = sum(self.levels.values())
+        return {
+            "success": success,
+            "total": total,
+            "errors": sum(count for levelno, count in self.levels.items() if levelno >= ERROR_LEVEL),
+            "warnings": sum(count for levelno, count in self.levels.items()
+                            if logging.WARNING <= levelno < ERROR_LEVEL and levelno != ASSERTION_SATISFIED),
+            "truncated": total - len(self.records),
+            "levels": {level_name(levelno): count for levelno, count in sorted(self.levels.items(), reverse=True)},
+            "codes": dict(self.codes.most_common(self.max_codes)),
+            "messages": [
+                {
+                    "code": getattr(record, "messageCode", "") or "",
+                    "level": level_name(record.levelno),
+                    "message": self._text(record),
+                    "refs": self._refs(record),
+                }
+                for record in self.records
+            ],
+        }
+
+
+def summary_header(report):
+    """Compact JSON summary of a report for the X-Validation-Summary response header."""
+    return json_codec.dumps({field: report[field] for field in SUMMARY_FIELDS}).decode()
+
+
+class ValidationReports:
+    """
+    Validation reports by result key. With a `store` (a ResultCache of their own, so report
+    lookups do not count as result cache hits or misses), reports are kept on disk as long
+    as the LRU policy allows; without one, the `keep` most recent are held in memory.
+    """
+
+    def __init__(self, store=None, keep=200):
+        self.store = store
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+    def put(self, key, report):
+        if self.store:
+            self.store.put(key, json_codec.dumps(report))
+            return
+        with self._lock:
+            self._memory[key] = report
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.keep:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """The report stored under `key`, or None. Blocking when reports are kept on disk."""
+        if self.store:
+            data = self.store.get(key)
+            return json_codec.loads(data) if data is not None else None
+        with self._lock:
+            return self._memory.get(key)
+
+
+def message_capture_from_env():
+    """
+    MessageCapture settings from the environment; plain values, so they can be sent to a
+    worker process:
+
+    ARELLE_VALIDATION_LOG_LEVEL          lowest level captured (default warning), standard or
+                                         Arelle names such as inconsistency or error-semantic
+    ARELLE_VALIDATION_MAX_MESSAGES       messages kept per conversion, the rest are only counted
+    ARELLE_VALIDATION_MAX_REFS           references kept per message
+    ARELLE_VALIDATION_MAX_MESSAGE_CHARS  message texts are cut to this length
+    """
+    return {
+        "level": level_number(os.getenv('ARELLE_VALIDATION_LOG_LEVEL', 'warning')),
+        "max_messages": int(os.getenv('ARELLE_VALIDATION_MAX_MESSAGES', '200')),
+        "max_refs": int(os.getenv('ARELLE_VALIDATION_MAX_REFS', '10')),
+        "max_message_chars": int(os.getenv('ARELLE_VALIDATION_MAX_MESSAGE_CHARS', '1000')),
+    }
+
+
+def validation_reports_from_env(result_cache=None):
+    """
+    With a `result_cache`, reports are kept on disk in its "validation" subdirectory, up to
+    ARELLE_VALIDATION_REPORTS_MAX_MB; without one, ARELLE_VALIDATION_REPORTS_KEEP of them
+    are held in memory.
+    """
+    store = None
+    max_mb = int(os.getenv('ARELLE_VALIDATION_REPORTS_MAX_MB', '64'))
+    if result_cache and max_mb:
+        store = ResultCache(os.path.join(result_cache.directory, 'validation'), max_mb * 2**20)
+    return ValidationReports(store, keep=int(os.getenv('ARELLE_VALIDATION_REPORTS_KEEP', '200')))
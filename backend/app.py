@@ -1,20 +1,73 @@
 # backend/app.py
 
-import io
+import asyncio
 import logging
 import os
+import shutil
 import sys
+import tempfile
+import time
 import traceback
+from contextlib import asynccontextmanager
+from typing import Optional
 
-import requests
 from dotenv import load_dotenv
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Form
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Form, Header, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from prometheus_client import Counter
+from starlette.background import BackgroundTask
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-app = FastAPI()
+from arelle_client import arelle_client_from_env
+from compression import CompressionMiddleware, compression_from_env, etag_matches, strong_etag, weak_etag
+from enrichment import ENRICH_MODES, EsrsEnricher, FactIndex, enrichment_cache_from_env
+# backend/utils is on sys.path once enrichment is imported
+from corpus_store import corpus_store_from_env, sha256_of
+import json_codec
+from fact_table import EXPORT_FORMATS, facts_to_table, pa, write_table
+from jobs import JobQueueFull, job_manager_from_env
+from metrics import (RequestTimings, TimingMiddleware, counter, gauge, metrics_response_body,
+                     register_callback, request_timings)
+from profiling import PROFILE_HEADER, REQUEST_ID_HEADER, profiled_call, profiler_from_env, request_id_from
+from upload_limits import MaxBodySizeMiddleware
+
+arelle_client = None
+job_manager = None
+esrs_enricher = None
+enrichment_cache = None
+corpus_store = None
+profiler = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP client towards the Arelle service for the lifetime of the app
+    global arelle_client, job_manager, esrs_enricher, enrichment_cache, corpus_store, profiler
+    arelle_client = arelle_client_from_env()
+    await arelle_client.start()
+    # The ESRS snapshot, its concept index and paragraph texts are loaded once, up front
+    esrs_enricher = await asyncio.to_thread(EsrsEnricher)
+    enrichment_cache = await asyncio.to_thread(enrichment_cache_from_env)
+    corpus_store = await asyncio.to_thread(corpus_store_from_env)
+    # None unless PROFILE_SAMPLE_RATE or PROFILE_HEADER_ENABLED switch profiling on
+    profiler = profiler_from_env()
+    job_manager = job_manager_from_env(convert_job)
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    await arelle_client.close()
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse serialised with json_codec (orjson when it is installed)."""
+
+    def render(self, content):
+        return json_codec.dumps(content)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=CodecJSONResponse)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +79,7 @@ logger = logging.getLogger("app")
 logger.setLevel(logging.INFO)
 
 logger.info("Backend application initialized and ready to receive requests")
+logger.info(f"JSON codec: {json_codec.ENGINE}")
 
 load_dotenv()
 
@@ -34,6 +88,15 @@ cors_origins = os.getenv('CORS_ORIGINS',
                          'http://localhost:5173,http://localhost:3000,https://xbrl-to-json.openearth.dev')
 origins = cors_origins.split(',')
 
+# Uploads are refused with 413 while streaming in, as soon as they pass this size
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=int(os.getenv('MAX_UPLOAD_MB', '512')) * 2**20)
+
+# JSON answers are compressed (zstd / br / gzip, as negotiated) off the event loop
+app.add_middleware(CompressionMiddleware, **compression_from_env())
+
+# Outermost, so "receive" and "send" include the other middlewares' work
+app.add_middleware(TimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -55,7 +118,7 @@ async def test_endpoint():
 async def global_exception_handler(request, exc):
     print(f"Unhandled exception: {exc}")
     traceback.print_exc()
-    return JSONResponse(
+    return CodecJSONResponse(
         status_code=500,
         content={"error": "Internal Server Error"},
     )
@@ -63,7 +126,7 @@ async def global_exception_handler(request, exc):
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(
+    return CodecJSONResponse(
         status_code=exc.status_code,
         content={"error": exc.detail},
     )
@@ -71,7 +134,7 @@ async def http_exception_handler(request, exc):
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-    return JSONResponse(
+    return CodecJSONResponse(
         status_code=422,
         content={"error": exc.errors()},
     )
@@ -82,7 +145,205 @@ async def validation_exception_handler(request, exc):
 #######################################################
 @app.get("/")
 async def read_root():
-    return JSONResponse({"message": "Hello NINA from the XBRL/JSON converter"})
+    return CodecJSONResponse({"message": "Hello NINA from the XBRL/JSON converter"})
+
+
+async def json_envelope(fields, json_chunks):
+    """
+    Yield {**fields, "json_data": <document>} with the already serialised JSON document
+    spliced in chunk by chunk, so it is never parsed or re-serialised here.
+    """
+    yield json_codec.dumps(fields)[:-1] + b', "json_data": '
+    async for chunk in json_chunks:
+        yield chunk
+    yield b'}'
+
+
+async def iter_file(path, chunk_size=64 * 1024):
+    with open(path, 'rb') as f:
+        while chunk := await asyncio.to_thread(f.read, chunk_size):
+            yield chunk
+
+
+async def save_response(response, path):
+    """Write the body of a streamed Arelle response to `path` and close the response."""
+    with open(path, 'wb') as f:
+        async for chunk in arelle_client.iter_bytes(response):
+            await asyncio.to_thread(f.write, chunk)
+
+
+async def enrich_result(conversion_key, source_path, target_path, fact_index=None, profile_id=None):
+    """
+    Write the ESRS-enriched version of the converted OIM JSON at `source_path` to
+    `target_path`, off the event loop, filling `fact_index` if given. Enrichments are
+    cached under the key of the conversion they were made from; with a `profile_id` the
+    enrichment is always run, profiled, and its profile stored under that id.
+    Returns (enrichment seconds, "HIT" or "MISS").
+    """
+    key = esrs_enricher.cache_key(conversion_key) if enrichment_cache and conversion_key else None
+    if key and not profile_id:
+        cached = await asyncio.to_thread(enrichment_cache.get, key)
+        if cached is not None:
+            with open(target_path, 'wb') as f:
+                await asyncio.to_thread(f.write, cached)
+            if fact_index is not None:
+                report = await asyncio.to_thread(json_codec.loads, cached)
+                await asyncio.to_thread(fact_index.add_report, report)
+            return 0.0, "HIT"
+    profile = profiler.options(profile_id, "enrich") if profile_id else None
+    seconds = await asyncio.to_thread(profiled_call, profile, esrs_enricher.enrich_file,
+                                      source_path, target_path, fact_index)
+    if profile_id:
+        logger.info(f"Enrichment profiled as {profile_id}")
+        await asyncio.to_thread(profiler.prune)
+    if key:
+        await asyncio.to_thread(enrichment_cache.put_file, key, target_path)
+    return seconds, "MISS"
+
+
+async def tee_to_file(chunks, path):
+    """Yield `chunks` unchanged while writing a copy of them to `path`."""
+    with open(path, 'wb') as f:
+        async for chunk in chunks:
+            await asyncio.to_thread(f.write, chunk)
+            yield chunk
+
+
+def store_in_corpus(json_path, source_hash, enriched=False):
+    """
+    Ingest a converted (or, with `enriched`, ESRS-enriched) document into the corpus store,
+    if one is configured. The filing is keyed by `source_hash`, the SHA-256 of the upload:
+    uploading it again stores nothing, unless it now comes enriched (or enriched from other
+    ESRS data), which only rewrites the facts that changed. Blocking; failures are logged,
+    not raised.
+    """
+    if corpus_store is None:
+        return None
+    try:
+        result = corpus_store.ingest_file(json_path, source_hash,
+                                          enrichment=esrs_enricher.fingerprint if enriched else None)
+        logger.info(f"Corpus ingest of {source_hash}: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Corpus ingest of {source_hash} failed: {e}")
+        return None
+
+
+def store_and_remove(json_path, source_hash, temp_dir, enriched=False):
+    try:
+        store_in_corpus(json_path, source_hash, enriched)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def profile_id_for(header, request_id=None):
+    """The id to profile a request under, or None when it is not profiled (always when profiling is off)."""
+    if profiler is None or not profiler.wanted(header):
+        return None
+    return request_id_from(request_id)
+
+
+def profile_headers(profile_id):
+    """
+    Headers asking the Arelle service to profile the conversion under the same id; it does
+    so when its own PROFILE_HEADER_ENABLED is set.
+    """
+    return {PROFILE_HEADER: "1", REQUEST_ID_HEADER: profile_id} if profile_id else None
+
+
+# Fields of a validation report small enough for a job event
+VALIDATION_SUMMARY_FIELDS = ("profile", "success", "total", "errors", "warnings", "truncated")
+
+
+def with_profile(report, response):
+    """A validation report of the Arelle service, labelled with the profile it was made with."""
+    return {"profile": response.headers.get("X-Validation-Profile"), **report}
+
+
+async def validation_report(response):
+    """
+    The "validation" section of a conversion: what Arelle logged while converting. The
+    messages are fetched from the Arelle service only when its X-Validation-Summary counts
+    any, so clean filings cost no extra request. None when Arelle sent no summary.
+    """
+    summary = response.headers.get("X-Validation-Summary")
+    if not summary:
+        return None
+    report = json_codec.loads(summary)
+    result_key = response.headers.get("X-Result-Key")
+    if report.get("total") and result_key:
+        report = await arelle_client.validation(result_key) or report
+    return with_profile(report, response)
+
+
+def validation_summary(report):
+    return {field: report[field] for field in VALIDATION_SUMMARY_FIELDS if field in report}
+
+
+def arelle_error(response):
+    """The {"error": ...} body of an Arelle error answer (read already), also when a proxy sent it."""
+    try:
+        return {"error": response.json()["error"]}
+    except (ValueError, KeyError, TypeError):
+        return {"error": f"Arelle service answered {response.status_code}"}
+
+
+def retry_after_header(response):
+    retry_after = response.headers.get("Retry-After")
+    return {"Retry-After": retry_after} if retry_after else None
+
+
+def etag_header(etag, headers=None):
+    headers = dict(headers or {})
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers=etag_header(etag))
+
+
+#######################################################
+# Metrics
+#######################################################
+CONVERSIONS = Counter("backend_conversions", "Conversions by Arelle result cache outcome", ["cache"])
+
+
+def record_conversion(response, started, timings):
+    """Time the Arelle call up to its response headers and keep Arelle's own stage breakdown."""
+    timings.add("arelle", time.perf_counter() - started)
+    timings.add_server_timing(response.headers.get("Server-Timing"), "arelle_")
+    CONVERSIONS.labels(response.headers.get("X-Cache", "MISS").lower()).inc()
+
+
+def backend_metrics():
+    statuses = [job.status for job in job_manager.jobs()] if job_manager else []
+    yield gauge("backend_jobs", "Jobs held by status",
+                {status: statuses.count(status) for status in ("queued", "running", "completed", "failed")},
+                label="status")
+    yield gauge("backend_job_workers", "Job workers converting in parallel", job_manager.workers if job_manager else 0)
+    if enrichment_cache:
+        stats = enrichment_cache.stats()
+        yield counter("backend_enrichment_cache_lookups", "Enrichment cache lookups by outcome",
+                      {"hit": stats["hits"], "miss": stats["misses"]}, label="result")
+        yield gauge("backend_enrichment_cache_bytes", "Bytes held by the enrichment cache on disk", stats["bytes"])
+
+
+register_callback(backend_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = metrics_response_body()
+    return Response(content=body, media_type=content_type)
+
+
+def unknown_enrich_mode(enrich):
+    return CodecJSONResponse(
+        {"error": f"Unknown enrich mode '{enrich}', expected one of: {', '.join(ENRICH_MODES)}"},
+        status_code=400
+    )
 
 
 #######################################################
@@ -90,45 +351,382 @@ async def read_root():
 #######################################################
 @app.post("/upload_file")
 async def upload_file(
+        request: Request,
         file: UploadFile = File(...),
-        websocket_user_id: str = Form(...)
+        websocket_user_id: str = Form(...),
+        enrich: Optional[str] = Form(None),
+        validation: Optional[str] = Form(None),
+        if_none_match: Optional[str] = Header(None),
+        x_profile: Optional[str] = Header(None),
+        x_request_id: Optional[str] = Header(None)
 ):
     logger.info("upload_file endpoint called")
     user_id = websocket_user_id
     logger.info(f"Received upload request from user: {user_id} with file: {file.filename}")
+    if enrich and enrich not in ENRICH_MODES:
+        return unknown_enrich_mode(enrich)
+    profile_id = profile_id_for(x_profile, x_request_id)
 
     try:
-        # Read the file content directly from the uploaded file
-        file_content = await file.read()
-
-        # Call Arelle service
-        arelle_url = os.getenv('ARELLE_URL', 'http://xbrl-to-json-converter_arelle_service_1:8001')
-        logger.info(f"Calling Arelle service at {arelle_url}")
-
-        # Create files dictionary with BytesIO to avoid temporary file creation
-        files = {
-            'file': (file.filename, io.BytesIO(file_content), 'application/zip')
-        }
-
-        headers = {
-            'Accept': 'application/json'
-        }
-
-        # Send the request to Arelle service
-        response = requests.post(f'{arelle_url}/convert/',  files=files, headers=headers)
-        response.raise_for_status()
-        json_data = response.json()
+        # Stream the spooled upload to the Arelle service; the converted document is streamed back
+        logger.info(f"Calling Arelle service at {arelle_client.base_url}")
+        started = time.perf_counter()
+        # A plain conversion has the ETag Arelle gives it, so Arelle can answer a revalidation itself
+        response = await arelle_client.convert(file.filename, file.file,
+                                               if_none_match=None if enrich else if_none_match,
+                                               headers=profile_headers(profile_id), validation=validation)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            if response.status_code == 400:
+                # e.g. a validation profile the Arelle service does not offer
+                return CodecJSONResponse(response.json(), status_code=400)
+            if response.status_code == 422:
+                # A filing Arelle could not convert, answered with what it logged about it
+                body = response.json()
+                return CodecJSONResponse({"error": body["error"],
+                                          "validation": with_profile(body["validation"], response)},
+                                         status_code=422)
+            if response.status_code in (503, 504):
+                # Arelle's queue is full or the conversion timed out: let the client back off
+                return CodecJSONResponse(arelle_error(response), status_code=response.status_code,
+                                         headers=retry_after_header(response))
+        if response.status_code != 304:
+            response.raise_for_status()
+        timings = request_timings(request)
+        record_conversion(response, started, timings)
+        result_key = response.headers.get("X-Result-Key")
+        etag = None
+        if result_key:
+            # The enriched envelope carries this request's timings, so its bodies are only equivalent
+            etag = weak_etag(esrs_enricher.cache_key(result_key)) if enrich else strong_etag(result_key)
+        if response.status_code == 304 or etag_matches(if_none_match, etag):
+            await response.aclose()
+            logger.info("Upload matches the client's copy, answering 304")
+            return not_modified(etag)
         logger.info("File successfully converted by Arelle service")
+        source_hash = await asyncio.to_thread(sha256_of, file.file) if corpus_store is not None else None
+
+        if enrich:
+            return await enriched_upload_response(response, started, source_hash, etag, timings, profile_id)
 
-        return JSONResponse(
-            {
-                "message": "XBRL File uploaded & converted successfully",
-                "json_data": json_data
-            },
-            status_code=200
+        fields = {"message": "XBRL File uploaded & converted successfully"}
+        validation = await validation_report(response)
+        if validation:
+            fields["validation"] = validation
+        chunks = arelle_client.iter_bytes(response)
+        background = None
+        if corpus_store is not None:
+            # Keep a copy of the streamed document and ingest it once the response is sent
+            temp_dir = tempfile.mkdtemp(prefix="xbrl-corpus-")
+            converted_path = os.path.join(temp_dir, "converted.json")
+            chunks = tee_to_file(chunks, converted_path)
+            background = BackgroundTask(store_and_remove, converted_path, source_hash, temp_dir)
+
+        return StreamingResponse(
+            json_envelope(fields, chunks),
+            status_code=200,
+            media_type="application/json",
+            # Tell the caller whether Arelle answered from its result cache
+            headers=etag_header(etag, {"X-Cache": response.headers.get("X-Cache", "MISS"),
+                                       **({"X-Profile-Id": profile_id} if profile_id else {})}),
+            background=background
         )
 
     except Exception as e:
         logger.error(f"Error during file upload and conversion: {e}")
         traceback.print_exc()
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return CodecJSONResponse({"error": str(e)}, status_code=500)
+
+
+async def enriched_upload_response(response, started, source_hash=None, etag=None, timings=None, profile_id=None):
+    """
+    Download the converted document, enrich it with ESRS references and stream the
+    enriched document back. Conversion and enrichment are timed separately and reported
+    in the envelope's "timings" and, as stages of `timings`, the Server-Timing header.
+    With a `profile_id`, the enrichment is profiled under it. The enriched document goes to
+    the corpus store as the conversion of the upload hashed `source_hash`.
+    """
+    timings = timings or RequestTimings()
+    temp_dir = tempfile.mkdtemp(prefix="xbrl-enrich-")
+    try:
+        converted_path = os.path.join(temp_dir, "converted.json")
+        enriched_path = os.path.join(temp_dir, "enriched.json")
+        with timings.stage("download"):
+            await save_response(response, converted_path)
+        conversion_seconds = time.perf_counter() - started
+        enrichment_seconds, enrichment_cache_status = await enrich_result(
+            response.headers.get("X-Result-Key"), converted_path, enriched_path, profile_id=profile_id
+        )
+        timings.add("enrich", enrichment_seconds)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    logger.info(f"Converted in {conversion_seconds:.3f}s, enriched in {enrichment_seconds:.3f}s")
+
+    fields = {
+        "message": "XBRL File uploaded, converted & enriched successfully",
+        "timings": {"conversion_seconds": conversion_seconds, "enrichment_seconds": enrichment_seconds},
+    }
+    validation = await validation_report(response)
+    if validation:
+        fields["validation"] = validation
+    return StreamingResponse(
+        json_envelope(fields, iter_file(enriched_path)),
+        status_code=200,
+        media_type="application/json",
+        headers=etag_header(etag, {
+            "X-Cache": response.headers.get("X-Cache", "MISS"),
+            "X-Enrichment-Cache": enrichment_cache_status,
+            **({"X-Profile-Id": profile_id} if profile_id else {}),
+        }),
+        background=BackgroundTask(store_and_remove, enriched_path, source_hash, temp_dir, True)
+    )
+
+
+#######################################################
+# Job API: queue a conversion, poll it or follow it over a WebSocket
+#######################################################
+async def convert_job(manager, job):
+    """Run one queued upload through the Arelle service and store the OIM JSON on disk."""
+    await manager.publish(job, "converting")
+    timings = RequestTimings()
+    started = time.perf_counter()
+    with open(job.upload_path, 'rb') as upload:
+        response = await arelle_client.convert(job.filename, upload, headers=profile_headers(job.profile_id),
+                                               validation=job.validation)
+    if response.is_error:
+        await response.aread()
+        await response.aclose()
+        if response.status_code == 422:
+            # Arelle could not convert the filing; keep what it logged about it on the job
+            body = response.json()
+            job.validation_report = with_profile(body["validation"], response)
+            await manager.publish(job, "validated", **validation_summary(job.validation_report))
+            raise RuntimeError(body["error"])
+        raise RuntimeError(f"Arelle service answered {response.status_code}: {response.text}")
+    record_conversion(response, started, timings)
+    with timings.stage("download"):
+        await save_response(response, job.result_path)
+    await manager.publish(job, "converted", cache=response.headers.get("X-Cache", "MISS"))
+    job.validation_report = await validation_report(response)
+    if job.validation_report:
+        await manager.publish(job, "validated", **validation_summary(job.validation_report))
+    result_key = response.headers.get("X-Result-Key")
+    if result_key:
+        # Weak: the /jobs/{id} body also carries the job's summary (ids, stage timestamps)
+        job.etag = weak_etag(esrs_enricher.cache_key(result_key) if job.enrich else result_key)
+
+    if job.enrich:
+        enriched_path = os.path.join(job.directory, "enriched.json")
+        fact_index = FactIndex()
+        seconds, cache_status = await enrich_result(
+            response.headers.get("X-Result-Key"), job.result_path, enriched_path, fact_index, job.profile_id
+        )
+        timings.add("enrich", seconds)
+        os.replace(enriched_path, job.result_path)
+        job.fact_index = fact_index
+        await manager.publish(job, "enriched", seconds=seconds, cache=cache_status)
+
+    if corpus_store is not None:
+        with open(job.upload_path, 'rb') as upload:
+            source_hash = await asyncio.to_thread(sha256_of, upload)
+        stored = await asyncio.to_thread(store_in_corpus, job.result_path, source_hash, job.enrich)
+        if stored:
+            await manager.publish(job, "stored", **stored)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+        file: UploadFile = File(...),
+        websocket_user_id: str = Form(...),
+        enrich: Optional[str] = Form(None),
+        validation: Optional[str] = Form(None),
+        x_profile: Optional[str] = Header(None)
+):
+    logger.info(f"Queueing conversion job for user: {websocket_user_id} with file: {file.filename}")
+    if enrich and enrich not in ENRICH_MODES:
+        return unknown_enrich_mode(enrich)
+    try:
+        job = await job_manager.submit(websocket_user_id, file.filename, file.file, enrich=enrich,
+                                       profile=profiler is not None and profiler.wanted(x_profile),
+                                       validation=validation)
+    except JobQueueFull as e:
+        return CodecJSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "30"})
+    return CodecJSONResponse({"job_id": job.id, "status": job.status}, status_code=202)
+
+
+@app.get("/profiles")
+async def list_profiles():
+    if profiler is None:
+        return CodecJSONResponse({"enabled": False, "profiles": []})
+    return CodecJSONResponse({"enabled": True, "profiles": await asyncio.to_thread(profiler.profiles)})
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """
+    Summaries (slowest functions, top allocations) of the profiles of one request or job:
+    the backend's enrichment and, fetched from the Arelle service, its conversion.
+    """
+    summaries = await asyncio.to_thread(profiler.summaries, profile_id) if profiler else None
+    summaries = dict(summaries or {})
+    arelle = await arelle_client.profile(profile_id)
+    if arelle:
+        summaries.update({f"arelle_{label}": summary for label, summary in arelle.items()})
+    if not summaries:
+        return CodecJSONResponse({"error": "Profile not found"}, status_code=404)
+    return CodecJSONResponse(summaries)
+
+
+@app.get("/profiles/{profile_id}/{name}")
+async def get_profile_file(profile_id: str, name: str):
+    """One stored file of the backend: a .prof for pstats / snakeviz, .folded stacks for a flamegraph or a .json summary."""
+    path = profiler.file(profile_id, name) if profiler else None
+    if path is None:
+        return CodecJSONResponse({"error": "Profile not found"}, status_code=404)
+    return FileResponse(path, media_type="application/json" if name.endswith(".json") else "application/octet-stream",
+                        filename=name)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, if_none_match: Optional[str] = Header(None)):
+    job = job_manager.get(job_id)
+    if job is None:
+        return CodecJSONResponse({"error": f"Job {job_id} not found"}, status_code=404)
+    if job.status != "completed":
+        return CodecJSONResponse(job.summary())
+    if etag_matches(if_none_match, job.etag):
+        return not_modified(job.etag)
+    return StreamingResponse(
+        json_envelope(job.summary(), iter_file(job.result_path)),
+        media_type="application/json",
+        headers=etag_header(job.etag)
+    )
+
+
+@app.websocket("/ws/{user_id}")
+async def job_events(websocket: WebSocket, user_id: str):
+    """Push the stage events of every job submitted with this websocket_user_id."""
+    await websocket.accept()
+    job_manager.connect(user_id, websocket)
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        job_manager.disconnect(user_id, websocket)
+
+
+#######################################################
+# Fact queries over enriched jobs
+#######################################################
+def fact_query(document, paragraph, role, concept):
+    return {"document": document, "paragraph": paragraph, "role": role, "concept": concept}
+
+
+@app.get("/jobs/{job_id}/facts")
+async def job_facts(job_id: str, document: Optional[str] = None, paragraph: Optional[str] = None,
+                    role: Optional[str] = None, concept: Optional[str] = None):
+    """
+    Fact ids of an enriched job that match every given filter: ESRS document (and
+    paragraph), linkRole (URI, "role-200510" or definition) and concept. Without
+    filters, the job's index summary is returned.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return CodecJSONResponse({"error": f"Job {job_id} not found"}, status_code=404)
+    if job.fact_index is None:
+        return CodecJSONResponse({"error": f"Job {job_id} has no enriched facts (status: {job.status})"},
+                            status_code=409)
+    query = fact_query(document, paragraph, role, concept)
+    if not any(query.values()):
+        return CodecJSONResponse({"job_id": job_id, **job.fact_index.summary()})
+    return CodecJSONResponse({"job_id": job_id, "query": query, "fact_ids": job.fact_index.query(**query)})
+
+
+@app.get("/facts")
+async def facts(document: Optional[str] = None, paragraph: Optional[str] = None,
+                role: Optional[str] = None, concept: Optional[str] = None):
+    """The same query as /jobs/{job_id}/facts, over every enriched job still held."""
+    query = fact_query(document, paragraph, role, concept)
+    if not any(query.values()):
+        return CodecJSONResponse({"error": "Give at least one of: document, paragraph, role, concept"},
+                            status_code=400)
+    matches = {}
+    for job in job_manager.jobs():
+        if job.fact_index is not None:
+            fact_ids = job.fact_index.query(**query)
+            if fact_ids:
+                matches[job.id] = fact_ids
+    return CodecJSONResponse({"query": query, "matches": matches})
+
+
+#######################################################
+# Columnar export of a job's facts
+#######################################################
+def export_job_facts(job, path, format):
+    report = json_codec.read_json(job.result_path)
+    write_table(facts_to_table(report, report=job.filename), path, format)
+
+
+@app.get("/jobs/{job_id}/export")
+async def export_job(job_id: str, format: str = "parquet"):
+    """
+    The facts of a completed job as a Parquet or Arrow IPC table: one row per fact, typed
+    columns for concept, entity, period, unit and decimals, one dictionary-encoded column
+    per dimension axis, and the ESRS references when the job was enriched.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return CodecJSONResponse({"error": f"Job {job_id} not found"}, status_code=404)
+    if format not in EXPORT_FORMATS:
+        return CodecJSONResponse({"error": f"Unknown export format '{format}', expected one of: "
+                                      f"{', '.join(EXPORT_FORMATS)}"}, status_code=400)
+    if pa is None:
+        return CodecJSONResponse({"error": "Columnar export is not available: pyarrow is not installed"},
+                            status_code=501)
+    if job.status != "completed":
+        return CodecJSONResponse({"error": f"Job {job_id} is not completed (status: {job.status})"},
+                            status_code=409)
+    path = os.path.join(job.directory, f"facts.{format}")
+    if not os.path.exists(path):
+        await asyncio.to_thread(export_job_facts, job, path, format)
+    stem = os.path.splitext(os.path.basename(job.filename or "facts"))[0]
+    return FileResponse(path, media_type=EXPORT_FORMATS[format], filename=f"{stem}.{format}")
+
+
+#######################################################
+# Queries over the corpus store (CORPUS_DB)
+#######################################################
+def corpus_disabled():
+    return CodecJSONResponse({"error": "The corpus store is not enabled, set CORPUS_DB"}, status_code=404)
+
+
+@app.get("/corpus/filings")
+async def corpus_filings():
+    if corpus_store is None:
+        return corpus_disabled()
+    filings, stats = await asyncio.gather(asyncio.to_thread(corpus_store.filings),
+                                          asyncio.to_thread(corpus_store.stats))
+    return CodecJSONResponse({"stats": stats, "filings": filings})
+
+
+@app.get("/corpus/facts")
+async def corpus_facts(concept: Optional[str] = None, entity: Optional[str] = None,
+                       period_start: Optional[str] = None, period_end: Optional[str] = None,
+                       filing: Optional[str] = None, limit: int = 1000):
+    """
+    Stored facts matching every given filter: concept, entity, filing (upload file name)
+    and a period range on the fact's period end date.
+    """
+    if corpus_store is None:
+        return corpus_disabled()
+    query = {"concept": concept, "entity": entity, "period_start": period_start,
+             "period_end": period_end, "filing_key": filing}
+    if not any(query.values()):
+        return CodecJSONResponse({"error": "Give at least one of: concept, entity, period_start, period_end, filing"},
+                            status_code=400)
+    facts = await asyncio.to_thread(corpus_store.query_facts, limit=min(limit, 10000), **query)
+    return CodecJSONResponse({"query": query, "facts": facts})
@@ -0,0 +1,143 @@
+# backend/arelle_client.py
+
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+logger = logging.getLogger("app")
+
+# Responses worth another attempt: the Arelle service is restarting or its queue is full.
+RETRYABLE_STATUS_CODES = {502, 503}
+
+# Arelle's admission control answer when its conversion queue is full
+BUSY_STATUS_CODE = 503
+
+
+class ArelleClient:
+    """
+    Shared, pooled async HTTP client for the Arelle service.
+
+    One httpx.AsyncClient is reused for every upload, so connections are kept alive between
+    requests. A semaphore caps how many conversions the backend has in flight towards
+    Arelle at once; it is held for one attempt at a time, never while waiting to retry.
+    Connection failures and 502/503 answers are retried with jittered exponential backoff;
+    a conversion is keyed by the uploaded bytes on the Arelle side, so sending it again is
+    safe. Waiting on a full Arelle queue (503) is capped at `busy_retry_budget` seconds in
+    total, after which its 503 and Retry-After go back to the caller.
+    """
+
+    def __init__(self, base_url, max_connections=10, max_concurrency=4, connect_timeout=5.0,
+                 read_timeout=600.0, retries=3, backoff=0.5, busy_retry_budget=15.0):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.busy_retry_budget = busy_retry_budget
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            base = min(float(retry_after), 30.0)
+        else:
+            base = self.backoff * 2 ** attempt
+        return base + random.uniform(0, base)
+
+    async def convert(self, filename, fileobj, if_none_match=None, headers=None, validation=None):
+        """
+        Send a filing to /convert/ and return the streamed response once its headers arrive.
+        With `if_none_match`, the answer is a bodiless 304 when it matches the result's ETag.
+        `headers` are added to the request (e.g. X-Profile / X-Request-ID); `validation`
+        names the validation profile, the Arelle service's default when None.
+        The upload is read from `fileobj` in chunks (rewound for every attempt), so it is
+        never held in memory as a whole. The caller owns the response and must close it
+        (see iter_bytes()).
+        """
+        busy_budget = self.busy_retry_budget
+        for attempt in range(self.retries + 1):
+            fileobj.seek(0)
+            files = {'file': (filename, fileobj, 'application/zip')}
+            request_headers = {'Accept': 'application/json', **(headers or {})}
+            if if_none_match:
+                request_headers['If-None-Match'] = if_none_match
+            data = {'validation': validation} if validation else None
+            request = self._client.build_request("POST", "/convert/", files=files, data=data,
+                                                 headers=request_headers)
+            try:
+                async with self._semaphore:
+                    response = await self._client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self._delay(attempt)
+                logger.warning(f"Arelle service unreachable ({e!r}), retrying in {delay:.1f}s")
+            else:
+                busy = response.status_code == BUSY_STATUS_CODE
+                if (response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.retries
+                        or (busy and busy_budget <= 0)):
+                    return response
+                await response.aclose()
+                delay = self._delay(attempt, response)
+                if busy:
+                    delay = min(delay, busy_budget)
+                    busy_budget -= delay
+                logger.warning(f"Arelle service answered {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def profile(self, request_id):
+        """The Arelle service's profile summaries of `request_id`, or None if it has none."""
+        try:
+            response = await self._client.get(f"/profiles/{request_id}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not fetch the Arelle profile of {request_id}: {e!r}")
+            return None
+        return response.json() if response.status_code == 200 else None
+
+    async def validation(self, result_key):
+        """The Arelle service's validation report of the conversion keyed `result_key`, or None."""
+        try:
+            response = await self._client.get(f"/validation/{result_key}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not fetch the validation report of {result_key}: {e!r}")
+            return None
+        return response.json() if response.status_code == 200 else None
+
+    @staticmethod
+    async def iter_bytes(response, chunk_size=64 * 1024):
+        """Yield the decoded body of a streamed response and close it afterwards."""
+        try:
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+        finally:
+            await response.aclose()
+
+
+def arelle_client_from_env():
+    return ArelleClient(
+        base_url=os.getenv('ARELLE_URL', 'http://xbrl-to-json-converter_arelle_service_1:8001'),
+        max_connections=int(os.getenv('ARELLE_MAX_CONNECTIONS', '10')),
+        max_concurrency=int(os.getenv('ARELLE_MAX_CONCURRENCY', '4')),
+        connect_timeout=float(os.getenv('ARELLE_CONNECT_TIMEOUT', '5')),
+        read_timeout=float(os.getenv('ARELLE_READ_TIMEOUT', '600')),
+        retries=int(os.getenv('ARELLE_RETRIES', '3')),
+        backoff=float(os.getenv('ARELLE_RETRY_BACKOFF', '0.5')),
+        busy_retry_budget=float(os.getenv('ARELLE_BUSY_RETRY_BUDGET', '15')),
+    )
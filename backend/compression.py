@@ -0,0 +1,265 @@
+# backend/compression.py
+
+import asyncio
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Media types worth compressing; everything else (zips, Parquet, ...) is sent as-is
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# Streams whose chunks must reach the client as they are produced
+STREAMED_TYPES = ("application/x-ndjson",)
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        return self._compressor.compress(data) + (self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else b'')
+
+    def finish(self, data=b''):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data, flush=False):
+        return self._compressor.process(data) + (self._compressor.flush() if flush else b'')
+
+    def finish(self, data=b''):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data, flush=False):
+        return self._compressor.compress(data) + (
+            self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else b'')
+
+    def finish(self, data=b''):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+ENCODERS = {"gzip": _Gzip}
+if brotli:
+    ENCODERS["br"] = _Brotli
+if zstandard:
+    ENCODERS["zstd"] = _Zstd
+
+
+def _accepted(accept_encoding):
+    """{coding: q} of an Accept-Encoding header."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def accepts(accept_encoding, coding):
+    accepted = _accepted(accept_encoding or '')
+    return accepted.get(coding, accepted.get('*', 0.0)) > 0
+
+
+def negotiate(accept_encoding, preference):
+    """
+    The coding the client accepts with the highest q (ties go to the earlier entry of
+    `preference`), or None if it accepts none of them.
+    """
+    if not accept_encoding:
+        return None
+    accepted = _accepted(accept_encoding)
+    best = None
+    for coding in preference:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if coding in ENCODERS and q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def strong_etag(key):
+    return f'"{key}"'
+
+
+def weak_etag(key):
+    """ETag of a body that is equivalent, not byte-identical, each time (e.g. it holds timings)."""
+    return f'W/"{key}"'
+
+
+def etag_variant(etag, coding):
+    """The ETag of the `coding`-compressed representation: "<key>" -> "<key>-gzip"."""
+    if etag.endswith('"') and etag.removeprefix('W/').startswith('"'):
+        return f'{etag[:-1]}-{coding}"'
+    return etag
+
+
+def add_vary(headers):
+    """ASGI response `headers` with Accept-Encoding added (once) to their Vary header."""
+    kept, values = [], []
+    for name, value in headers:
+        if name.lower() == b"vary":
+            values.extend(item.strip() for item in value.split(b",") if item.strip())
+        else:
+            kept.append((name, value))
+    if b"accept-encoding" not in (value.lower() for value in values):
+        values.append(b"Accept-Encoding")
+    return kept + [(b"vary", b", ".join(values))]
+
+
+def etag_matches(if_none_match, etag):
+    """
+    True when an If-None-Match header matches `etag` or one of its compressed variants,
+    whichever representation the client was sent before.
+    """
+    if not if_none_match or not etag:
+        return False
+    # If-None-Match compares weakly: W/"x" and "x" match each other
+    candidates = {tag.removeprefix('W/') for tag in {etag} | {etag_variant(etag, coding) for coding in ENCODERS}}
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/') in candidates:
+            return True
+    return False
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses JSON responses with the best coding the client
+    accepts (zstd, br or gzip, as far as zstandard / brotli are installed).
+
+    Bodies smaller than `min_bytes` are sent as-is. Compression runs in a worker thread,
+    chunk by chunk, so large documents never block the event loop. Responses that already
+    carry a Content-Encoding are left alone; an ETag is rewritten to the variant of the
+    coding used, so each representation keeps a tag of its own. Every response that could
+    have been compressed carries Vary: Accept-Encoding, the identity ones included, so a
+    shared cache never hands one representation to a client that negotiated the other.
+    """
+
+    def __init__(self, app, min_bytes=1024, encodings=("zstd", "br", "gzip")):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.encodings = encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        coding = negotiate(headers.get(b"accept-encoding", b"").decode('latin-1'), self.encodings)
+        if coding is None:
+            async def identity_send(message):
+                if message["type"] == "http.response.start" and self._negotiable(message):
+                    message = {**message, "headers": add_vary(message.get("headers", []))}
+                await send(message)
+
+            await self.app(scope, receive, identity_send)
+            return
+
+        start = None
+        passthrough = False
+        encoder = None
+        flush = False
+        buffered = []
+        buffered_bytes = 0
+
+        async def compressing_send(message):
+            nonlocal start, passthrough, encoder, flush, buffered_bytes
+            if message["type"] == "http.response.start":
+                response_headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode('latin-1')
+                passthrough = message["status"] == 304 or not self._negotiable(message)
+                flush = content_type.startswith(STREAMED_TYPES)
+                if message["status"] == 304:
+                    # Tag a revalidation with the ETag the compressed 200 would have carried
+                    message = self._compressed_start(message, coding, etag_only=True)
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                buffered.append(body)
+                buffered_bytes += len(body)
+                if more_body and buffered_bytes < self.min_bytes and not flush:
+                    return
+                if not more_body and buffered_bytes < self.min_bytes:
+                    await send({**start, "headers": add_vary(start.get("headers", []))})
+                    await send({"type": "http.response.body", "body": b''.join(buffered)})
+                    return
+                encoder = ENCODERS[coding]()
+                await send(self._compressed_start(start, coding))
+                body = b''.join(buffered)
+                buffered.clear()
+
+            if more_body:
+                data = await asyncio.to_thread(encoder.compress, body, flush)
+            else:
+                data = await asyncio.to_thread(encoder.finish, body)
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    def _negotiable(start):
+        """Whether the response could be sent compressed: a body of a compressible type, or a 304."""
+        headers = {name.lower(): value for name, value in start.get("headers", [])}
+        if b"content-encoding" in headers:
+            return False
+        if start["status"] == 304:
+            return True
+        content_type = headers.get(b"content-type", b"").decode('latin-1')
+        return start["status"] >= 200 and start["status"] != 204 and content_type.startswith(COMPRESSIBLE_TYPES)
+
+    @staticmethod
+    def _compressed_start(start, coding, etag_only=False):
+        headers = []
+        for name, value in start.get("headers", []):
+            lowered = name.lower()
+            if lowered == b"content-length":
+                continue
+            if lowered == b"etag":
+                value = etag_variant(value.decode('latin-1'), coding).encode('latin-1')
+            headers.append((name, value))
+        if not etag_only:
+            headers.append((b"content-encoding", coding.encode()))
+        return {**start, "headers": add_vary(headers)}
+
+
+def compression_from_env():
+    """Middleware options from COMPRESS_MIN_BYTES and COMPRESS_ENCODINGS (order of preference)."""
+    return {
+        "min_bytes": int(os.getenv('COMPRESS_MIN_BYTES', '1024')),
+        "encodings": tuple(
+            coding.strip() for coding in os.getenv('COMPRESS_ENCODINGS', 'zstd,br,gzip').split(',') if coding.strip()
+        ),
+    }
@@ -0,0 +1,71 @@
+# backend/enrichment.py
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from result_cache import ResultCache, cache_key
+
+# The ESRS helpers in utils/ are flat script modules that import each other by name
+UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils')
+if UTILS_DIR not in sys.path:
+    sys.path.insert(0, UTILS_DIR)
+
+from compact_snapshot import load_compact_snapshot  # noqa: E402
+from esrs_text_store import default_store  # noqa: E402
+from fact_index import FactIndex  # noqa: E402
+import fill_esrs  # noqa: E402
+import json_codec  # noqa: E402
+
+logger = logging.getLogger("app")
+
+# Values accepted for the `enrich` form field
+ENRICH_MODES = ("esrs",)
+
+
+class EsrsEnricher:
+    """
+    Adds ESRS references to converted OIM JSON with fill_esrs.enhance_report_with_esrs_references.
+
+    The esrs_json.json snapshot (as a compact_snapshot.CompactSnapshot, which is its own
+    concept index) and the ESRS paragraph texts are loaded once when the enricher is created
+    and held for the lifetime of the app. `fingerprint`
+    identifies the ESRS data in use, so cached enrichments are not reused across changes
+    to it. enrich_file() is blocking and meant to run in a thread.
+    """
+
+    def __init__(self):
+        self.snapshot = load_compact_snapshot()
+        default_store().load_all()
+        self.fingerprint = fill_esrs.esrs_fingerprint()
+        logger.info(f"ESRS enrichment ready: {len(self.snapshot)} concepts indexed")
+
+    def cache_key(self, conversion_key):
+        """Key of the enriched result of the conversion Arelle keyed as `conversion_key`."""
+        return cache_key(conversion_key, ["esrs", self.fingerprint])
+
+    def enrich_file(self, source_path, target_path, fact_index=None):
+        """
+        Write the enriched version of the OIM JSON at `source_path` to `target_path`, adding
+        its facts to `fact_index` if given; returns seconds.
+        """
+        started = time.perf_counter()
+        report = json_codec.read_json(source_path)
+        fill_esrs.enhance_report_with_esrs_references(report, self.snapshot, fact_index)
+        json_codec.write_json(target_path, report)
+        return time.perf_counter() - started
+
+
+def enrichment_cache_from_env():
+    """
+    Cache of enriched results, sized by ENRICH_CACHE_MAX_MB (0 disables it) and stored
+    under ENRICH_CACHE_DIR.
+    """
+    max_mb = int(os.getenv('ENRICH_CACHE_MAX_MB', '256'))
+    if not max_mb:
+        return None
+    directory = os.getenv('ENRICH_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'esrs-enrichment-cache'))
+    memory_mb = int(os.getenv('ENRICH_CACHE_MEMORY_MB', '0'))
+    return ResultCache(directory, max_mb * 2**20, memory_mb * 2**20)
@@ -0,0 +1,174 @@
+# backend/jobs.py
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+# backend/utils is on sys.path once enrichment is imported (app.py does so first)
+import json_codec
+
+logger = logging.getLogger("app")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class JobQueueFull(Exception):
+    """The job queue has no room for another upload."""
+
+
+class Job:
+    def __init__(self, user_id, filename, directory, enrich=None, profile=False, validation=None):
+        self.id = uuid.uuid4().hex
+        self.validation = validation  # validation profile asked for, None for the Arelle service's default
+        self.validation_report = None  # what Arelle logged while converting, once it has
+        self.profile_id = self.id if profile else None  # profiles of a profiled job are stored by job id
+        self.user_id = user_id
+        self.filename = filename
+        self.enrich = enrich
+        self.fact_index = None  # FactIndex of the enriched result
+        self.etag = None  # weak ETag of the result, from the conversion (and enrichment) key
+        self.directory = directory
+        self.upload_path = os.path.join(directory, "upload")
+        self.result_path = os.path.join(directory, "result.json")
+        self.status = "queued"
+        self.stages = []
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def summary(self):
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "enrich": self.enrich,
+            "validation": self.validation_report or {"profile": self.validation},
+            "profile_id": self.profile_id,
+            "status": self.status,
+            "stages": self.stages,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    In-process job queue for conversions that outlive a single HTTP request.
+
+    Uploads are copied to a per-job directory and queued; `workers` tasks run them through
+    `run_job(manager, job)` one at a time each. Every stage a job passes is recorded on the
+    job and pushed to the WebSockets its user has open. Finished jobs and their result files
+    are dropped `result_ttl` seconds after they complete.
+    """
+
+    def __init__(self, run_job, workers=2, max_queued=100, result_ttl=3600, directory=None):
+        self.run_job = run_job
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="xbrl-jobs-")
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._sockets = {}
+        self._tasks = []
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._expire()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    async def submit(self, user_id, filename, fileobj, enrich=None, profile=False, validation=None):
+        """Copy the upload into a new job directory and queue it; raises JobQueueFull."""
+        if self._queue.full():
+            raise JobQueueFull("The conversion queue is full")
+        job = Job(user_id, filename, tempfile.mkdtemp(dir=self.directory), enrich, profile, validation)
+        await asyncio.to_thread(self._copy_upload, fileobj, job.upload_path)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            shutil.rmtree(job.directory, ignore_errors=True)
+            raise JobQueueFull("The conversion queue is full")
+        self._jobs[job.id] = job
+        await self.publish(job, "uploaded")
+        return job
+
+    @staticmethod
+    def _copy_upload(fileobj, path):
+        fileobj.seek(0)
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(fileobj, target, CHUNK_SIZE)
+
+    async def publish(self, job, stage, **details):
+        """Record a stage on the job and push it to the user's open WebSockets."""
+        event = {"job_id": job.id, "stage": stage, "at": time.time(), **details}
+        job.stages.append(event)
+        for websocket in list(self._sockets.get(job.user_id, ())):
+            try:
+                await websocket.send_text(json_codec.dumps(event).decode())
+            except Exception:
+                self.disconnect(job.user_id, websocket)
+
+    def connect(self, user_id, websocket):
+        self._sockets.setdefault(user_id, set()).add(websocket)
+
+    def disconnect(self, user_id, websocket):
+        sockets = self._sockets.get(user_id)
+        if sockets:
+            sockets.discard(websocket)
+            if not sockets:
+                del self._sockets[user_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                await self.run_job(self, job)
+                job.status = "completed"
+                await self.publish(job, "completed")
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+                await self.publish(job, "failed", error=str(e))
+            finally:
+                job.finished_at = time.time()
+                if os.path.exists(job.upload_path):
+                    os.remove(job.upload_path)
+                self._queue.task_done()
+
+    async def _expire(self):
+        while True:
+            await asyncio.sleep(min(60, self.result_ttl))
+            cutoff = time.time() - self.result_ttl
+            for job_id, job in list(self._jobs.items()):
+                if job.finished_at and job.finished_at < cutoff:
+                    del self._jobs[job_id]
+                    shutil.rmtree(job.directory, ignore_errors=True)
+
+
+def job_manager_from_env(run_job):
+    return JobManager(
+        run_job,
+        workers=int(os.getenv('JOB_WORKERS', '2')),
+        max_queued=int(os.getenv('JOB_QUEUE_SIZE', '100')),
+        result_ttl=int(os.getenv('JOB_RESULT_TTL', '3600')),
+        directory=os.getenv('JOB_DIR'),
+    )
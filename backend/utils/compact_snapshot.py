@@ -0,0 +1,165 @@
+import os
+import sys
+
+import json_codec
+
+ESRS_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'esrs_data')
+
+# Keys of the {"type", "references", ...} dict of a concept that get a slot of their own
+_DETAIL_SLOTS = {"type": "type", "references": "references", "pref.Label": "pref_label"}
+
+# Key orders seen in the snapshot, shared between nodes so each node stores one reference
+_shapes = {}
+
+
+def _shape(keys):
+    keys = tuple(sys.intern(key) for key in keys)
+    return _shapes.setdefault(keys, keys)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class LinkRoleNode:
+    """One ["linkRole", {"role", "definition"}, {...}, concepts...] group of the snapshot."""
+
+    __slots__ = ('role', 'definition', 'details', 'children', '_list')
+
+    def __init__(self, role, definition, details=None):
+        self.role = role
+        self.definition = definition
+        self.details = details
+        self.children = ()
+        self._list = None
+
+    def to_list(self):
+        """The group in the list shape of esrs_json.json, built once and shared: do not modify it."""
+        if self._list is None:
+            head = {"role": self.role, "definition": self.definition}
+            self._list = ["linkRole", head, dict(self.details or {})] + [child.to_list() for child in self.children]
+        return self._list
+
+
+class ConceptNode:
+    """
+    One ["concept", {"name", "label"}, {"type", "references", ...}, children...] entry.
+    `parent` is the enclosing concept or linkRole node, `group` the owning linkRole node.
+    """
+
+    __slots__ = ('name', 'label', 'type', 'references', 'pref_label', 'extra', 'shape',
+                 'children', 'parent', 'group', '_list')
+
+    def __init__(self, name, label, details, parent, group):
+        self.name = name
+        self.label = label
+        self.type = None
+        self.references = None
+        self.pref_label = None
+        self.extra = None
+        self.shape = _shape(details)
+        for key, value in details.items():
+            slot = _DETAIL_SLOTS.get(key)
+            if slot:
+                setattr(self, slot, _intern(value))
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+        self.children = ()
+        self.parent = parent
+        self.group = group
+        self._list = None
+
+    def details(self):
+        """The concept's {"type", "references", ...} dict, keys in their original order."""
+        result = {}
+        for key in self.shape:
+            slot = _DETAIL_SLOTS.get(key)
+            result[key] = getattr(self, slot) if slot else self.extra[key]
+        return result
+
+    def to_list(self):
+        """
+        The concept (with its children) in the list shape of esrs_json.json, built once and
+        shared with the list of its group: do not modify it.
+        """
+        if self._list is None:
+            self._list = (["concept", {"name": self.name, "label": self.label}, self.details()]
+                          + [child.to_list() for child in self.children])
+        return self._list
+
+
+class CompactSnapshot:
+    """
+    The esrs_json.json presentation tree as __slots__ nodes with interned strings and
+    parent pointers. `concepts` maps every concept name to its first occurrence in
+    depth-first order, the one find_concept_group returns for the raw tree.
+    """
+
+    def __init__(self, raw_snapshot):
+        self.concepts = {}
+        groups = raw_snapshot.get('presentation', []) if isinstance(raw_snapshot, dict) else []
+        self.groups = tuple(self._group(group) for group in groups)
+
+    def _group(self, raw):
+        head = raw[1] if len(raw) > 1 and isinstance(raw[1], dict) else {}
+        details = raw[2] if len(raw) > 2 and isinstance(raw[2], dict) else None
+        group = LinkRoleNode(_intern(head.get("role")), _intern(head.get("definition")), details or None)
+        group.children = self._children(raw, group, group)
+        return group
+
+    def _children(self, raw, parent, group):
+        return tuple(
+            self._concept(child, parent, group)
+            for child in raw[3:]
+            if isinstance(child, list) and child and child[0] == "concept"
+        )
+
+    def _concept(self, raw, parent, group):
+        head = raw[1]
+        details = raw[2] if len(raw) > 2 and isinstance(raw[2], dict) else {}
+        node = ConceptNode(_intern(head.get("name")), head.get("label"), details, parent, group)
+        self.concepts.setdefault(node.name, node)
+        node.children = self._children(raw, node, group)
+        return node
+
+    def __len__(self):
+        return len(self.concepts)
+
+    def find(self, name):
+        """The ConceptNode named `name`, or None."""
+        return self.concepts.get(name)
+
+    def get(self, name):
+        """(concept node, linkRole node, references string), or (None, None, None)."""
+        node = self.concepts.get(name)
+        if node is None:
+            return None, None, None
+        return node, node.group, node.references
+
+    def to_raw(self):
+        """
+        The whole snapshot back in the shape json.load gives for esrs_json.json, made of the
+        nodes' shared list views.
+        """
+        return {"presentation": [group.to_list() for group in self.groups]}
+
+
+def find_concept_group(snapshot, tag):
+    """
+    Adapter with the result shape of find_concept_group.find_concept_group: (concept list,
+    group list) for `tag`, or (None, None). A group's list view is built on its first
+    lookup and reused after that, so the lists are shared and read-only, like the raw tree
+    nodes a ConceptIndex returns.
+    """
+    node = snapshot.find(tag)
+    if node is None:
+        return None, None
+    return node.to_list(), node.group.to_list()
+
+
+def load_compact_snapshot(path=None):
+    """Load esrs_json.json (or `path`) straight into a CompactSnapshot."""
+    path = path or os.path.join(ESRS_DIRECTORY, 'esrs_json.json')
+    return CompactSnapshot(json_codec.read_json(path))
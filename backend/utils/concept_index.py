@@ -0,0 +1,91 @@
+import os
+
+import json_codec
+
+ESRS_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'esrs_data')
+
+# Indexes of the snapshots seen most recently, as (snapshot, index) pairs. The snapshot is
+# kept referenced so its id() cannot be reused by another object while it is cached.
+_MAX_CACHED_INDEXES = 4
+_indexes = {}
+
+
+class ConceptIndex:
+    """
+    Lookup table over the 'presentation' tree of an ESRS taxonomy snapshot:
+    concept name -> (concept node, owning linkRole group, references string).
+
+    Built with one walk of the tree in the same depth-first order as find_concept, keeping
+    the first occurrence of every name, so find() answers exactly what
+    find_concept_group(snapshot, name) would, without walking the tree again.
+    """
+
+    def __init__(self, snapshot):
+        self._concepts = {}
+        groups = snapshot.get('presentation', []) if isinstance(snapshot, dict) else []
+        if isinstance(groups, list):
+            for group in groups:
+                self._add_group(group)
+
+    def _add_group(self, group):
+        concepts = self._concepts
+        stack = [group]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                if len(node) >= 2 and node[0] == "concept":
+                    concept_data = node[1]
+                    if isinstance(concept_data, dict):
+                        name = concept_data.get("name")
+                        if name not in concepts:
+                            concepts[name] = (node, group, _references_of(node))
+                stack.extend(reversed(node))
+            elif isinstance(node, dict):
+                stack.extend(reversed(list(node.values())))
+
+    def __len__(self):
+        return len(self._concepts)
+
+    def __contains__(self, name):
+        return name in self._concepts
+
+    def get(self, name):
+        """(concept, group, references) for `name`, or (None, None, None) if unknown."""
+        return self._concepts.get(name, (None, None, None))
+
+    def find(self, name):
+        """(concept, group) for `name`, like find_concept_group()."""
+        concept, group, _ = self.get(name)
+        return concept, group
+
+
+def _references_of(concept):
+    if len(concept) >= 3 and isinstance(concept[2], dict):
+        return concept[2].get("references")
+    return None
+
+
+def concept_index_for(snapshot):
+    """
+    The ConceptIndex of `snapshot`, built on first use and reused for later calls with the
+    same snapshot object. The snapshot is treated as read-only once indexed.
+    """
+    cached = _indexes.get(id(snapshot))
+    if cached is not None and cached[0] is snapshot:
+        return cached[1]
+    index = ConceptIndex(snapshot)
+    if len(_indexes) >= _MAX_CACHED_INDEXES:
+        del _indexes[next(iter(_indexes))]
+    _indexes[id(snapshot)] = (snapshot, index)
+    return index
+
+
+_snapshot = None
+
+
+def load_snapshot():
+    """Load esrs_json.json once per process and return the shared snapshot."""
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = json_codec.read_json(os.path.join(ESRS_DIRECTORY, 'esrs_json.json'))
+    return _snapshot
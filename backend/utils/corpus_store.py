@@ -0,0 +1,258 @@
+"""
+Embedded SQLite store of converted filings and their facts.
+
+One row per filing and one row per fact. Filings are keyed by the hash of their source
+filing (or a source key given by the caller), so two reports only share a row when they
+were converted from the same source. A source already stored is skipped, unless it comes
+back with a different ESRS enrichment (an enriched document after a plain one, or one
+enriched from other ESRS data): then only the facts that were added, changed or removed
+are written. Facts are indexed on concept, period
+and entity, so the corpus can be queried without converting anything again.
+
+    python corpus_store.py corpus.db ingest converted/*.json
+    python corpus_store.py corpus.db query --concept esrs:GrossScope1GreenhouseGasEmissions
+    python corpus_store.py corpus.db stats
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import json_codec
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS filings (
+    filing_key   TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    enrichment   TEXT NOT NULL,
+    ingested_at  REAL NOT NULL,
+    fact_count   INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facts (
+    filing_key     TEXT NOT NULL,
+    fact_id        TEXT NOT NULL,
+    fact_hash      TEXT NOT NULL,
+    concept        TEXT,
+    entity         TEXT,
+    period_start   TEXT,
+    period_end     TEXT,
+    unit           TEXT,
+    decimals       INTEGER,
+    value          TEXT,
+    dimensions     TEXT NOT NULL,
+    esrs_reference TEXT,
+    PRIMARY KEY (filing_key, fact_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS facts_concept ON facts (concept);
+CREATE INDEX IF NOT EXISTS facts_period ON facts (period_end, period_start);
+CREATE INDEX IF NOT EXISTS facts_entity ON facts (entity);
+"""
+
+FACT_COLUMNS = ("filing_key", "fact_id", "fact_hash", "concept", "entity", "period_start", "period_end",
+                "unit", "decimals", "value", "dimensions", "esrs_reference")
+
+
+def _period(period):
+    """(start, end) strings of an OIM period; start is None for instants."""
+    if not period:
+        return None, None
+    if '/' in period:
+        start, end = period.split('/', 1)
+        return start, end
+    return None, period
+
+
+def sha256_of(fileobj, chunk_size=2**20):
+    """Hex SHA-256 of a file object from its start (e.g. an upload), read in chunks."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while chunk := fileobj.read(chunk_size):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def fact_row(filing_key, fact_id, fact):
+    """The facts table row of one OIM fact."""
+    dimensions = fact.get("dimensions", {})
+    start, end = _period(dimensions.get("period"))
+    decimals = fact.get("decimals")
+    reference = fact.get("esrs_data_reference")
+    value = fact.get("value")
+    return (
+        filing_key, fact_id, hashlib.sha256(json_codec.dumps(fact, sort_keys=True)).hexdigest(),
+        dimensions.get("concept"), dimensions.get("entity"), start, end, dimensions.get("unit"),
+        decimals if isinstance(decimals, int) else None,
+        None if value is None else str(value),
+        json_codec.dumps(dimensions).decode(),
+        json_codec.dumps(reference).decode() if reference is not None else None,
+    )
+
+
+class CorpusStore:
+    """
+    A corpus database at `path`. Every method opens (and closes) its own connection, so a
+    store can be shared between threads; writes are serialised. Methods block and are
+    meant to run off the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection for one transaction: committed (or rolled back) and closed on exit."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ingest(self, report_data, content_hash, filing_key=None, enrichment=None):
+        """
+        Store the facts of one OIM JSON report converted from the source filing hashed
+        `content_hash`, under `filing_key` (by default `content_hash`). `enrichment` is the
+        fingerprint of the ESRS data an enriched report was made with, None for a plain one.
+        The report is skipped when the same source is stored with the same enrichment, or
+        enriched while this one is plain. Returns a summary of what was written:
+        {"filing_key", "status": "unchanged" | "new" | "revised", "added", "changed", "removed"}.
+        """
+        filing_key = filing_key or content_hash
+        enrichment = enrichment or ""
+        facts = report_data.get("facts", {})
+        with self._write_lock, self._connect() as conn:
+            filing = conn.execute(
+                "SELECT content_hash, enrichment FROM filings WHERE filing_key = ?", (filing_key,)
+            ).fetchone()
+            if (filing and filing["content_hash"] == content_hash
+                    and (filing["enrichment"] == enrichment or not enrichment)):
+                return {"filing_key": filing_key, "status": "unchanged", "added": 0, "changed": 0, "removed": 0}
+
+            stored = dict(conn.execute(
+                "SELECT fact_id, fact_hash FROM facts WHERE filing_key = ?", (filing_key,)
+            ).fetchall())
+            rows = [fact_row(filing_key, fact_id, fact) for fact_id, fact in facts.items()]
+            added = [row for row in rows if row[1] not in stored]
+            changed = [row for row in rows if row[1] in stored and stored[row[1]] != row[2]]
+            removed = [(filing_key, fact_id) for fact_id in stored if fact_id not in facts]
+
+            placeholders = ", ".join("?" for _ in FACT_COLUMNS)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO facts ({', '.join(FACT_COLUMNS)}) VALUES ({placeholders})",
+                added + changed
+            )
+            conn.executemany("DELETE FROM facts WHERE filing_key = ? AND fact_id = ?", removed)
+            conn.execute(
+                "INSERT OR REPLACE INTO filings (filing_key, content_hash, enrichment, ingested_at, fact_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (filing_key, content_hash, enrichment, time.time(), len(rows))
+            )
+        return {
+            "filing_key": filing_key,
+            "status": "revised" if stored else "new",
+            "added": len(added),
+            "changed": len(changed),
+            "removed": len(removed),
+        }
+
+    def ingest_file(self, path, content_hash=None, filing_key=None, enrichment=None):
+        """
+        ingest() an OIM JSON file. Without the `content_hash` of the filing it was converted
+        from, the JSON file itself stands for the source.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        return self.ingest(json_codec.loads(data), content_hash or hashlib.sha256(data).hexdigest(), filing_key,
+                           enrichment)
+
+    def query_facts(self, concept=None, entity=None, period_start=None, period_end=None,
+                    filing_key=None, limit=1000):
+        """
+        Facts matching every given filter, as dicts. `period_start` / `period_end` select
+        facts whose period ends on or after / on or before that date.
+        """
+        clauses, params = [], []
+        for column, value in (("concept", concept), ("entity", entity), ("filing_key", filing_key)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if period_start is not None:
+            clauses.append("period_end >= ?")
+            params.append(period_start)
+        if period_end is not None:
+            clauses.append("period_end <= ?")
+            params.append(period_end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM facts {where} ORDER BY filing_key, fact_id LIMIT ?", params + [limit]
+            ).fetchall()
+        facts = []
+        for row in rows:
+            fact = dict(row)
+            fact["dimensions"] = json_codec.loads(fact["dimensions"])
+            fact["esrs_reference"] = json_codec.loads(fact["esrs_reference"]) if fact["esrs_reference"] else None
+            facts.append(fact)
+        return facts
+
+    def filings(self):
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM filings ORDER BY ingested_at")]
+
+    def stats(self):
+        with self._connect() as conn:
+            return {
+                "filings": conn.execute("SELECT COUNT(*) FROM filings").fetchone()[0],
+                "facts": conn.execute("SELECT COUNT(*) FROM facts").fetchone()[0],
+                "concepts": conn.execute("SELECT COUNT(DISTINCT concept) FROM facts").fetchone()[0],
+            }
+
+
+def corpus_store_from_env():
+    """The corpus at CORPUS_DB, or None when it is not set (storing is off)."""
+    path = os.getenv('CORPUS_DB')
+    return CorpusStore(path) if path else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest converted filings into a SQLite corpus and query it.")
+    parser.add_argument("database", help="corpus database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="store OIM JSON reports, keyed by their hash")
+    ingest.add_argument("reports", nargs="+")
+    query = commands.add_parser("query", help="print matching facts as JSON Lines")
+    query.add_argument("--concept")
+    query.add_argument("--entity")
+    query.add_argument("--period-start")
+    query.add_argument("--period-end")
+    query.add_argument("--filing")
+    query.add_argument("--limit", type=int, default=1000)
+    commands.add_parser("stats", help="print corpus counts")
+    args = parser.parse_args(argv)
+
+    store = CorpusStore(args.database)
+    if args.command == "ingest":
+        for path in args.reports:
+            print(json_codec.dumps(store.ingest_file(path)).decode())
+    elif args.command == "query":
+        for fact in store.query_facts(args.concept, args.entity, args.period_start, args.period_end,
+                                      args.filing, args.limit):
+            print(json_codec.dumps(fact).decode())
+    else:
+        print(json_codec.dumps(store.stats()).decode())
+
+
+if __name__ == "__main__":
+    main()
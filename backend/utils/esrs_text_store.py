@@ -0,0 +1,150 @@
+import os
+import pickle
+import sys
+import threading
+import time
+
+import json_codec
+
+ESRS_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'esrs_data')
+
+# Where the serialised index is looked for (and written by `python esrs_text_store.py`)
+DEFAULT_INDEX_PATH = os.path.join(ESRS_DIRECTORY, 'esrs_text_index.pickle')
+
+INDEX_VERSION = 1
+
+
+class EsrsTextStore:
+    """
+    ESRS paragraph texts keyed by tag, one dict per ESRS_*.json document.
+
+    Documents are loaded lazily the first time one of their tags is looked up and kept in
+    memory. A document is reloaded when its file's mtime or size changes; files are
+    stat()ed at most once every `check_interval` seconds. When several items share a
+    tag, the first one wins, as with the linear scan this replaces.
+
+    A store can be saved to and started from a pickled index (see save_index and
+    load_index), so worker processes do not have to parse the JSON files themselves.
+    Entries from an index are checked against the files like any other.
+    """
+
+    def __init__(self, directory=ESRS_DIRECTORY, check_interval=2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._documents = {}  # filename -> (mtime_ns, size, {tag: text})
+        self._checked = {}  # filename -> time of the last stat()
+        self.loads = 0
+        self.generation = 0  # bumped whenever a document is (re)loaded
+
+    def _signature(self, path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, filename):
+        path = os.path.join(self.directory, filename)
+        signature = self._signature(path)
+        items = json_codec.read_json(path)
+        texts = {}
+        for item in items:
+            texts.setdefault(item.get('tag'), item.get('text'))
+        self.loads += 1
+        return signature + (texts,)
+
+    def document(self, filename):
+        """
+        {tag: text} of one ESRS document. Raises FileNotFoundError for a missing file and
+        ValueError (json.JSONDecodeError) for a file that is not valid JSON.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._documents.get(filename)
+            if entry is not None and now - self._checked.get(filename, 0) < self.check_interval:
+                return entry[2]
+        path = os.path.join(self.directory, filename)
+        if entry is not None and self._signature(path) == entry[:2]:
+            with self._lock:
+                self._checked[filename] = now
+            return entry[2]
+        entry = self._load(filename)
+        with self._lock:
+            self._documents[filename] = entry
+            self._checked[filename] = now
+            self.generation += 1
+        return entry[2]
+
+    def refresh(self):
+        """
+        Re-check the loaded documents against their files (within `check_interval`) and
+        return the generation, so callers caching derived results can tell they are stale.
+        """
+        with self._lock:
+            filenames = list(self._documents)
+        for filename in filenames:
+            try:
+                self.document(filename)
+            except (OSError, ValueError):
+                with self._lock:
+                    self._documents.pop(filename, None)
+                    self.generation += 1
+        return self.generation
+
+    def lookup(self, filename, tag):
+        """(found, text) for `tag` in the document stored as `filename`."""
+        texts = self.document(filename)
+        if tag in texts:
+            return True, texts[tag]
+        return False, None
+
+    def load_all(self):
+        """Load every ESRS_*.json document in the directory."""
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.startswith('ESRS_') and filename.endswith('.json'):
+                self.document(filename)
+
+    def save_index(self, path=DEFAULT_INDEX_PATH):
+        """Write the loaded documents to a pickled index (atomically replaced)."""
+        with self._lock:
+            documents = dict(self._documents)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"version": INDEX_VERSION, "documents": documents}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load_index(self, path=DEFAULT_INDEX_PATH):
+        """Start from a pickled index; returns False if there is none or it is unusable."""
+        try:
+            with open(path, 'rb') as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+            return False
+        with self._lock:
+            self._documents.update(index["documents"])
+        return True
+
+
+_default_store = None
+
+
+def default_store():
+    """
+    The process-wide store, started from the pickled index at ESRS_TEXT_INDEX (or the
+    default index path) when one exists.
+    """
+    global _default_store
+    if _default_store is None:
+        store = EsrsTextStore()
+        store.load_index(os.getenv('ESRS_TEXT_INDEX', DEFAULT_INDEX_PATH))
+        _default_store = store
+    return _default_store
+
+
+if __name__ == "__main__":
+    # Build the serialised index, e.g. at image build time
+    index_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INDEX_PATH
+    store = EsrsTextStore()
+    store.load_all()
+    store.save_index(index_path)
+    print(f"ESRS text index with {store.loads} documents written to {index_path}")
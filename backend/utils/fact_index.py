@@ -0,0 +1,104 @@
+from reference_resolver import simplify_tag_number
+
+
+class FactIndex:
+    """
+    Reverse indexes over the facts of an enriched report, answering "which facts disclose
+    ESRS E1 44" or "which facts sit under role-200510" without scanning every fact:
+
+    - by_document: ESRS document -> paragraph number -> fact ids
+    - by_role: linkRole URI -> fact ids (by_definition: role definition -> fact ids)
+    - by_concept: concept name -> fact ids
+
+    Facts are added from their "esrs_data_reference" (see
+    fill_esrs.enhance_report_with_esrs_references, which fills an index it is given).
+    """
+
+    def __init__(self):
+        self.by_document = {}
+        self.by_role = {}
+        self.by_definition = {}
+        self.by_concept = {}
+        self.facts = 0
+
+    def add(self, fact_id, fact_content):
+        reference = fact_content.get("esrs_data_reference")
+        if not reference:
+            return
+        self.facts += 1
+        if reference.get("concept"):
+            self.by_concept.setdefault(reference["concept"], set()).add(fact_id)
+        group = reference.get("concept_group") or {}
+        if group.get("role"):
+            self.by_role.setdefault(group["role"], set()).add(fact_id)
+        if group.get("definition"):
+            self.by_definition.setdefault(group["definition"], set()).add(fact_id)
+        for result in reference.get("parsed_references") or ():
+            document, paragraph = _document_and_paragraph(result)
+            if document:
+                self.by_document.setdefault(document, {}).setdefault(paragraph, set()).add(fact_id)
+
+    def add_report(self, report_data):
+        """Index every fact of an already enriched report."""
+        for fact_id, fact_content in report_data.get("facts", {}).items():
+            self.add(fact_id, fact_content)
+        return self
+
+    def facts_for_paragraph(self, document, paragraph=None):
+        """Fact ids referencing `document` (e.g. "ESRS E1"), optionally only paragraph "44"."""
+        paragraphs = self.by_document.get(document, {})
+        if paragraph is None:
+            return set().union(*paragraphs.values())
+        return set(paragraphs.get(simplify_tag_number(str(paragraph).lstrip('§ ')), ()))
+
+    def facts_for_role(self, role):
+        """Fact ids under a linkRole, given as its URI, its last segment ("role-200510") or its definition."""
+        if role in self.by_role:
+            return set(self.by_role[role])
+        if role in self.by_definition:
+            return set(self.by_definition[role])
+        matches = set()
+        for uri, fact_ids in self.by_role.items():
+            if uri.rsplit('/', 1)[-1] == role:
+                matches |= fact_ids
+        return matches
+
+    def facts_for_concept(self, concept):
+        return set(self.by_concept.get(concept, ()))
+
+    def query(self, document=None, paragraph=None, role=None, concept=None):
+        """Sorted fact ids matching all of the given criteria."""
+        selections = []
+        if document is not None:
+            selections.append(self.facts_for_paragraph(document, paragraph))
+        if role is not None:
+            selections.append(self.facts_for_role(role))
+        if concept is not None:
+            selections.append(self.facts_for_concept(concept))
+        if not selections:
+            return []
+        return sorted(set.intersection(*selections))
+
+    def summary(self):
+        """Fact counts per document and paragraph, role and concept."""
+        return {
+            "facts": self.facts,
+            "documents": {
+                document: {paragraph: len(ids) for paragraph, ids in sorted(paragraphs.items())}
+                for document, paragraphs in sorted(self.by_document.items())
+            },
+            "roles": {role: len(ids) for role, ids in sorted(self.by_role.items())},
+            "concepts": len(self.by_concept),
+        }
+
+
+def _document_and_paragraph(result):
+    """(document, paragraph number) of one parsed reference result, or (None, None)."""
+    if result.get("document") and result.get("tag"):
+        document = result["document"]
+        return document, simplify_tag_number(result["tag"][len(document):])
+    # Unresolved references only carry "ESRS E1 44 a"-style text; the document is two words
+    parts = (result.get("reference") or "").split()
+    if len(parts) < 3 or parts[0] != "ESRS" or parts[1] == "None":
+        return None, None
+    return f"{parts[0]} {parts[1]}", simplify_tag_number(' '.join(parts[2:]))
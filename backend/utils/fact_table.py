@@ -0,0 +1,191 @@
+"""
+Columnar export of OIM JSON facts for analytics.
+
+Every fact becomes one row with typed columns (concept, entity, period start/end, unit,
+decimals, value, numeric value) plus one dictionary-encoded column per dimension axis
+("dimension:<axis>"). If the facts carry an "esrs_data_reference", the concept group and
+references are joined in as esrs_* columns. Tables are written as Parquet or Arrow IPC.
+
+pyarrow (14 or later, for concat_tables(promote_options=...)) is in requirements.txt; the
+import stays optional so the rest of utils/ runs without it:
+
+    python fact_table.py facts.parquet converted/*.json
+    python fact_table.py facts.arrow converted/*.json --format arrow
+"""
+import argparse
+import os
+from datetime import datetime
+
+import json_codec
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+# Dimensions with a column of their own; every other key of "dimensions" is an axis
+CORE_DIMENSIONS = ("concept", "entity", "period", "unit", "language")
+
+DIMENSION_PREFIX = "dimension:"
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Columnar export needs pyarrow>=14, install it with: pip install 'pyarrow>=14'")
+
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _period(period):
+    """(start, end) of an OIM period: "start/end" for durations, start is None for instants."""
+    if not period:
+        return None, None
+    if '/' in period:
+        start, end = period.split('/', 1)
+        return _timestamp(start), _timestamp(end)
+    return None, _timestamp(period)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def flatten_facts(report_data, report=None):
+    """
+    The facts of an OIM JSON report as plain column lists ({column: [values]}), one entry
+    per fact. `report` (e.g. the filing's file name) fills the "report" column.
+    """
+    facts = report_data.get("facts", {})
+    columns = {
+        "report": [], "fact_id": [], "concept": [], "entity": [], "period_start": [], "period_end": [],
+        "unit": [], "language": [], "decimals": [], "value": [], "numeric_value": [],
+    }
+    axes = {}
+    esrs = {"esrs_concept_group_role": [], "esrs_concept_group_definition": [], "esrs_references": []}
+    has_esrs = False
+
+    for row, (fact_id, fact) in enumerate(facts.items()):
+        dimensions = fact.get("dimensions", {})
+        start, end = _period(dimensions.get("period"))
+        value = fact.get("value")
+        decimals = fact.get("decimals")
+        columns["report"].append(report)
+        columns["fact_id"].append(fact_id)
+        columns["concept"].append(dimensions.get("concept"))
+        columns["entity"].append(dimensions.get("entity"))
+        columns["period_start"].append(start)
+        columns["period_end"].append(end)
+        columns["unit"].append(dimensions.get("unit"))
+        columns["language"].append(dimensions.get("language"))
+        columns["decimals"].append(decimals if isinstance(decimals, int) else None)
+        columns["value"].append(None if value is None else str(value))
+        columns["numeric_value"].append(_number(value) if "unit" in dimensions or decimals is not None else None)
+
+        for axis, member in dimensions.items():
+            if axis not in CORE_DIMENSIONS:
+                axes.setdefault(axis, [None] * len(facts))[row] = None if member is None else str(member)
+
+        reference = fact.get("esrs_data_reference")
+        group = (reference or {}).get("concept_group") or {}
+        has_esrs = has_esrs or reference is not None
+        esrs["esrs_concept_group_role"].append(group.get("role"))
+        esrs["esrs_concept_group_definition"].append(group.get("definition"))
+        esrs["esrs_references"].append(
+            [result.get("reference") for result in (reference or {}).get("parsed_references") or ()]
+            if reference else None
+        )
+
+    for axis in sorted(axes):
+        columns[DIMENSION_PREFIX + axis] = axes[axis]
+    if has_esrs:
+        columns.update(esrs)
+    return columns
+
+
+# Column types; anything not listed (the dimension axes) is a dictionary-encoded string
+def _column_types():
+    return {
+        "report": pa.dictionary(pa.int32(), pa.string()),
+        "fact_id": pa.string(),
+        "concept": pa.dictionary(pa.int32(), pa.string()),
+        "entity": pa.dictionary(pa.int32(), pa.string()),
+        "period_start": pa.timestamp('s'),
+        "period_end": pa.timestamp('s'),
+        "unit": pa.dictionary(pa.int32(), pa.string()),
+        "language": pa.dictionary(pa.int32(), pa.string()),
+        "decimals": pa.int32(),
+        "value": pa.string(),
+        "numeric_value": pa.float64(),
+        "esrs_concept_group_role": pa.dictionary(pa.int32(), pa.string()),
+        "esrs_concept_group_definition": pa.dictionary(pa.int32(), pa.string()),
+        "esrs_references": pa.list_(pa.string()),
+    }
+
+
+def facts_to_table(report_data, report=None):
+    """The facts of an OIM JSON report as a pyarrow Table."""
+    require_pyarrow()
+    types = _column_types()
+    arrays = {}
+    for name, values in flatten_facts(report_data, report).items():
+        column_type = types.get(name, pa.dictionary(pa.int32(), pa.string()))
+        if pa.types.is_dictionary(column_type):
+            arrays[name] = pa.array(values, type=pa.string()).dictionary_encode()
+        else:
+            arrays[name] = pa.array(values, type=column_type)
+    return pa.table(arrays)
+
+
+def write_table(table, path, format="parquet"):
+    """Write `table` to `path` as Parquet or Arrow IPC (file format)."""
+    require_pyarrow()
+    if format == "parquet":
+        pq.write_table(table, path, compression="zstd")
+    elif format == "arrow":
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown export format '{format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+
+
+def export_reports(paths, output_path, format="parquet"):
+    """
+    Flatten the facts of every OIM JSON file in `paths` into one table written to
+    `output_path`. Axes missing from a report are null in its rows. Returns the row count.
+    """
+    require_pyarrow()
+    tables = []
+    for path in paths:
+        tables.append(facts_to_table(json_codec.read_json(path), report=os.path.basename(path)))
+    table = pa.concat_tables(tables, promote_options="default") if tables else pa.table({})
+    write_table(table, output_path, format)
+    return table.num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the facts of OIM JSON reports to Parquet or Arrow IPC.")
+    parser.add_argument("output", help="table to write")
+    parser.add_argument("reports", nargs="+", help="OIM JSON reports (converted, optionally enriched)")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="parquet")
+    args = parser.parse_args(argv)
+    rows = export_reports(args.reports, args.output, args.format)
+    print(f"Wrote {rows} facts from {len(args.reports)} reports to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
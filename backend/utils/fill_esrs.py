@@ -1,6 +1,11 @@
-import json
+import hashlib
 import os
-import re  # for the simplify_tag_number regex
+
+import json_codec
+from compact_snapshot import CompactSnapshot, LinkRoleNode
+from concept_index import concept_index_for
+from esrs_text_store import default_store
+from reference_resolver import ReferenceResolver, parse_references, simplify_tag_number, thaw
 
 # ----------------------------------------------------------------------------------------
 # Helper functions to handle references from ESRS or other relevant documents
@@ -9,88 +14,34 @@ import re  # for the simplify_tag_number regex
 
 ESRS_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'esrs_data')
 
-def simplify_tag_number(tag_number):
+def esrs_fingerprint():
     """
-    Extract only the first integer in the tag_number.
-    For example:
-        "11 c SBM-3" -> "11"
-        "10 b SBM-3" -> "10"
-    If no integer is found, returns the original tag_number unchanged.
+    SHA-256 over the snapshot and ESRS_*.json texts enrichment reads: it changes whenever
+    an enriched report could, so it tells enrichments from different ESRS data apart.
     """
-    m = re.search(r'^(\d+)', tag_number.strip())
-    if m:
-        return m.group(1)
-    return tag_number  # fallback: no digits found at start
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(ESRS_DIRECTORY)):
+        if name == 'esrs_json.json' or (name.startswith('ESRS_') and name.endswith('.json')):
+            digest.update(name.encode())
+            with open(os.path.join(ESRS_DIRECTORY, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
 
 def reference_endpoint(reference):
     """
     Endpoint to process the 'references' field only if it mentions ESRS and use the ESRS documents.
     Adds a 'reference' key in the result so you can see the exact references being processed.
+    Each distinct references string is resolved once; repeats are answered from the
+    resolver's LRU, as fresh dicts the caller is free to change.
     """
-    if 'ESRS' in reference:
-        parsed_references = parse_reference(reference)
-        if parsed_references:
-            results = []
-            for parsed_ref in parsed_references:
-                result = get_esrs_text(parsed_ref)
-                # Build a combined reference string: "ESRS S2 11 c SBM-3" for example
-                full_ref_str = f"{parsed_ref.get('document')} {parsed_ref.get('tag_number')}".strip()
-                
-                if result:
-                    # Add 'reference' to the found result
-                    result["reference"] = full_ref_str
-                    results.append(result)
-                else:
-                    # Insert 'reference' so you know which ref was not found
-                    results.append({
-                        "message": f"Tag not found in {parsed_ref.get('document')} (or no text for '{parsed_ref.get('tag_number')}')",
-                        "reference": full_ref_str
-                    })
-            return {"results": results}
-        else:
-            return {"results": None}
-    else:
-        # If the reference does not mention ESRS, do not process it
-        return {"results": None}
+    return {"results": thaw(reference_resolver.resolve(reference))}
 
 def parse_reference(reference):
     """
     Parses the reference string into structured components, processing only references that mention ESRS.
     Example of reference string: " ESRS ESRS 2 3 BP-1, ESRS E1 41 "
     """
-    references = [ref.strip() for ref in reference.strip().split(',') if ref.strip()]
-    parsed_list = []
-    for ref in references:
-        if 'ESRS' in ref:
-            parts = ref.strip().split()
-            parsed = {}
-            # Minimal check: must start with "ESRS"
-            if parts[0] == 'ESRS':
-                # We might have "ESRS ESRS 2 41" or "ESRS E1 41"
-                if len(parts) >= 3:
-                    if parts[1] == 'ESRS':
-                        # e.g. "ESRS ESRS 2 3 BP-1"
-                        document = f"{parts[1]} {parts[2]}"  # "ESRS 2"
-                        tag_number = ' '.join(parts[3:])
-                    else:
-                        # e.g. "ESRS E1 41"
-                        document = f"{parts[0]} {parts[1]}"  # "ESRS E1"
-                        tag_number = ' '.join(parts[2:])
-                    parsed = {
-                        "standard": parts[0],
-                        "document": document,
-                        "tag_number": tag_number
-                    }
-                else:
-                    parsed = {"reference": ref}
-                parsed_list.append(parsed)
-            else:
-                parsed = {"reference": ref}
-                parsed_list.append(parsed)
-        else:
-            # references not mentioning ESRS are ignored
-            continue
-    return parsed_list
+    return thaw(parse_references(reference))
 
 def get_esrs_text(parsed_ref):
     """
@@ -116,28 +67,27 @@ def get_esrs_text(parsed_ref):
     if not filename:
         return {"message": f"Document {document} not found in file mapping."}
 
-    file_path = os.path.join(ESRS_DIRECTORY, filename)
-    if not os.path.exists(file_path):
-        return {"message": f"File for {document} not found: {filename}"}
-
+    # Paragraph texts come from the shared store: each document is parsed once and keyed by tag
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            esrs_data = json.load(f)
+        found, text = default_store().lookup(filename, full_tag)
+    except FileNotFoundError:
+        return {"message": f"File for {document} not found: {filename}"}
     except Exception as e:
         return {"message": f"Error reading {filename}: {str(e)}"}
 
-    # Now we search for "ESRS S2 11" (for example) in esrs_data
-    for item in esrs_data:
-        if item.get('tag') == full_tag:
-            return {
-                "document": document,
-                "tag": full_tag,
-                "text": item.get('text')
-            }
+    if found:
+        return {
+            "document": document,
+            "tag": full_tag,
+            "text": text
+        }
 
     # If no match is found, return None
     return None
 
+# Resolved references strings, dropped whenever the ESRS text store reloads a document
+reference_resolver = ReferenceResolver(get_esrs_text, store=default_store())
+
 def map_document_to_filename(document):
     """
     Maps the ESRS document identifier to the corresponding JSON file name.
@@ -193,16 +143,9 @@ def find_concept_group(data, tag):
     Returns (concept_found, group_found).
     - concept_found: the list starting with "concept" if found
     - group_found: the item in the "presentation" list where the concept was found
+    Answered from the snapshot's ConceptIndex, which keeps the first match of find_concept.
     """
-    data_list = data.get('presentation', [])
-    if isinstance(data_list, list):
-        for item in data_list:
-            # Try to find the concept within this item
-            result = find_concept(item, tag)
-            if result:
-                # 'item' is the "group" that encloses that concept
-                return (result, item)
-    return (None, None)
+    return concept_index_for(data).find(tag)
 
 # ----------------------------------------------------------------------------------------
 # Main function that:
@@ -213,56 +156,81 @@ def find_concept_group(data, tag):
 # 5) Saves them in a new key "esrs_data_reference" in the fact dictionary
 # ----------------------------------------------------------------------------------------
 
-def enhance_report_with_esrs_references(report_data, esrs_reference_snapshot):
+def concept_lookup_for(esrs_reference_snapshot):
+    """
+    The concept lookup of a snapshot: a compact_snapshot.CompactSnapshot is its own lookup,
+    a raw json.load tree gets its ConceptIndex. Both answer get(name) with
+    (concept, group, references).
+    """
+    if isinstance(esrs_reference_snapshot, CompactSnapshot):
+        return esrs_reference_snapshot
+    return concept_index_for(esrs_reference_snapshot)
+
+def group_role_and_definition(group):
+    """(role, definition) of a linkRole group, given as a raw list or as a LinkRoleNode."""
+    if isinstance(group, LinkRoleNode):
+        return group.role, group.definition
+    if isinstance(group, list) and len(group) >= 2 and isinstance(group[1], dict):
+        return group[1].get("role"), group[1].get("definition")
+    return None, None
+
+def enhance_fact_with_esrs_references(fact_content, concept_index):
+    """
+    Adds the "esrs_data_reference" key to one fact, looking its concept up in `concept_index`
+    (see concept_lookup_for). Facts without a concept are left untouched.
     """
-    Goes through each fact in report_data["facts"], finds the concept in the esrs_reference_snapshot,
+    # 1) Extract the concept name from the 'dimensions'
+    dimensions = fact_content.get("dimensions", {})
+    concept_name = dimensions.get("concept")
+    if not concept_name:
+        return fact_content
+
+    # 2) Find the concept, its concept group and the references from its concept definition
+    found_concept, found_group, references_data = concept_index.get(concept_name)
+
+    # 3) Use reference_endpoint to parse and get actual references from ESRS if any
+    if references_data:
+        reference_info = reference_endpoint(references_data)
+    else:
+        reference_info = {"results": None}
+
+    # 4) Construct an object to store as "esrs_data_reference"
+    esrs_data_reference = {
+        "concept": concept_name,
+        "concept_group": None,
+        "parsed_references": reference_info["results"]
+    }
+
+    # If we want to store info about the group
+    concept_group_role, concept_group_definition = group_role_and_definition(found_group)
+    if concept_group_role or concept_group_definition:
+        esrs_data_reference["concept_group"] = {
+            "role": concept_group_role,
+            "definition": concept_group_definition
+        }
+
+    # 5) Attach esrs_data_reference to the fact
+    fact_content["esrs_data_reference"] = esrs_data_reference
+    return fact_content
+
+def enhance_report_with_esrs_references(report_data, esrs_reference_snapshot, fact_index=None):
+    """
+    Goes through each fact in report_data["facts"], finds the concept in the esrs_reference_snapshot
+    (a raw json.load tree or a compact_snapshot.CompactSnapshot),
     retrieves the references, and creates a new key "esrs_data_reference" in that fact.
+    With a fact_index.FactIndex, every enriched fact is also added to it on the way.
+    For reports too large to hold in memory, see stream_enrich.py.
     """
+    # One walk of the snapshot up front (none for a compact one), then a dictionary lookup per fact
+    concept_index = concept_lookup_for(esrs_reference_snapshot)
+    # Pick up changed ESRS documents once per report rather than once per fact
+    reference_resolver.refresh()
+
     # Loop through each fact in the report
     for fact_id, fact_content in report_data.get("facts", {}).items():
-        # 1) Extract the concept name from the 'dimensions'
-        dimensions = fact_content.get("dimensions", {})
-        concept_name = dimensions.get("concept")
-        if not concept_name:
-            continue
-
-        # 2) Find the concept and concept group from the snapshot
-        found_concept, found_group = find_concept_group(esrs_reference_snapshot, concept_name)
-
-        # 3) If we found the concept, let's try to extract references from the concept definition
-        references_data = None
-        if found_concept and len(found_concept) >= 3:
-            concept_details = found_concept[2]
-            if isinstance(concept_details, dict):
-                references_data = concept_details.get("references")
-
-        # 4) Use reference_endpoint to parse and get actual references from ESRS if any
-        if references_data:
-            reference_info = reference_endpoint(references_data)
-        else:
-            reference_info = {"results": None}
-
-        # 5) Construct an object to store as "esrs_data_reference"
-        esrs_data_reference = {
-            "concept": concept_name,
-            "concept_group": None,
-            "parsed_references": reference_info["results"]
-        }
-
-        # If we want to store info about the group
-        if isinstance(found_group, list) and len(found_group) >= 2:
-            group_role_def = found_group[1]
-            if isinstance(group_role_def, dict):
-                concept_group_role = group_role_def.get("role")
-                concept_group_definition = group_role_def.get("definition")
-                if concept_group_role or concept_group_definition:
-                    esrs_data_reference["concept_group"] = {
-                        "role": concept_group_role,
-                        "definition": concept_group_definition
-                    }
-
-        # 6) Attach esrs_data_reference to the fact
-        fact_content["esrs_data_reference"] = esrs_data_reference
+        enhance_fact_with_esrs_references(fact_content, concept_index)
+        if fact_index is not None:
+            fact_index.add(fact_id, fact_content)
 
     return report_data
 
@@ -274,26 +242,23 @@ def enhance_report_with_esrs_references(report_data, esrs_reference_snapshot):
 if __name__ == "__main__":
     try:
         # 1) Load an example filled report (replace with your file path)
-        with open(os.path.join(ESRS_DIRECTORY, 'example_filled.json'), 'r', encoding='utf-8') as f:
-            report_data = json.load(f)
+        report_data = json_codec.read_json(os.path.join(ESRS_DIRECTORY, 'example_filled.json'))
             
         # 2) Load the ESRS reference snapshot (replace with your file path)
-        with open(os.path.join(ESRS_DIRECTORY, 'esrs_json.json'), 'r', encoding='utf-8') as f:
-            esrs_reference_snapshot = json.load(f)
+        esrs_reference_snapshot = json_codec.read_json(os.path.join(ESRS_DIRECTORY, 'esrs_json.json'))
             
         # 3) Call the enhance function
         enhanced_report = enhance_report_with_esrs_references(report_data, esrs_reference_snapshot)
         
         # 4) Save the enhanced report
         output_path = os.path.join(ESRS_DIRECTORY, 'enhanced_report.json')
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(enhanced_report, f, indent=4, ensure_ascii=False)
+        json_codec.write_json(output_path, enhanced_report, indent=4)
             
         print(f"Enhanced report saved to {output_path}")
             
     except FileNotFoundError as e:
         print(f"Error: Required file not found - {e}")
-    except json.JSONDecodeError as e:
+    except ValueError as e:
         print(f"Error: Invalid JSON format - {e}")
     except Exception as e:
         print(f"Unexpected error: {e}")
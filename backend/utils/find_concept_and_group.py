@@ -1,20 +1,26 @@
 from pathlib import Path
-import json
-from find_concept_group import find_concept_group
+
+import json_codec
+from concept_index import concept_index_for
 
 # Get the path to the esrs_data directory relative to this file
 ESRS_DATA_DIR = Path(__file__).parent.parent / 'esrs_data'
 ESRS_JSON_PATH = ESRS_DATA_DIR / 'esrs_json.json'
 
+_esrs_json = None
+
 def open_json():
+    """Load esrs_json.json on first use; later calls return the same snapshot."""
+    global _esrs_json
+    if _esrs_json is not None:
+        return _esrs_json
     try:
-        with ESRS_JSON_PATH.open('r', encoding='utf-8') as file:
-            esrs_json = json.load(file)
-        return esrs_json
+        _esrs_json = json_codec.read_json(ESRS_JSON_PATH)
+        return _esrs_json
     except FileNotFoundError:
         print(f"Error: Could not find file at {ESRS_JSON_PATH}")
         return None
-    except json.JSONDecodeError:
+    except ValueError:
         print(f"Error: Invalid JSON in file {ESRS_JSON_PATH}")
         return None
 
@@ -33,7 +39,7 @@ def get_concept_and_group(tag):
     
     data = open_json()
 
-    concept, group = find_concept_group(data, tag)
+    concept, group = concept_index_for(data).find(tag)
     if concept and group:
         return {"concept": concept, "concept_group": group}
     else:
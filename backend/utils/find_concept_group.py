@@ -1,3 +1,4 @@
+from concept_index import concept_index_for
 
 
 def find_concept(data, tag):
@@ -32,11 +33,8 @@ def find_concept_group(data, tag):
         tuple: A tuple containing the concept and the concept group.
                The concept is the list starting with "concept" if found.
                The concept group is the item in the "presentation" list where the concept was found.
+
+    Lookups go through the snapshot's ConceptIndex (built once per snapshot), which returns
+    the same first match as walking the groups with find_concept.
     """
-    data_list = data.get('presentation', [])
-    if isinstance(data_list, list):
-        for item in data_list:
-            result = find_concept(item, tag)
-            if result:
-                return result, item
-    return (None, None)
\ No newline at end of file
+    return concept_index_for(data).find(tag)
@@ -1,5 +1,6 @@
 import os 
 import json
+from esrs_text_store import default_store
 ESRS_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'esrs_data')
 
 def reference_endpoint(reference):
@@ -79,23 +80,19 @@ def get_esrs_text(parsed_ref):
     if not filename:
         return {"message": f"Document {document} not found"}
 
-    # Load the corresponding JSON file
-    file_path = os.path.join(ESRS_DIRECTORY, filename)
+    # Look the tag up in the shared store, which parses each document once
+    full_tag = f"{document} {tag_number}"
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            esrs_data = json.load(f)
+        found, text = default_store().lookup(filename, full_tag)
     except FileNotFoundError:
         return {"message": f"File {filename} not found"}
 
-    # Search for the tag in the data
-    full_tag = f"{document} {tag_number}"
-    for item in esrs_data:
-        if item.get('tag') == full_tag:
-            return {
-                "document": document,
-                "tag": full_tag,
-                "text": item.get('text')
-            }
+    if found:
+        return {
+            "document": document,
+            "tag": full_tag,
+            "text": text
+        }
 
     # If tag not found
     return None
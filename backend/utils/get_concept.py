@@ -1,18 +1,16 @@
-import json
-from find_concept_group import find_concept_group
+from concept_index import concept_index_for, load_snapshot
 import os
 
 ESRS_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'esrs_data')
 
 def open_json():
-    with open('esrs_json.json') as file:
-        esrs_json = json.load(file)
-    return esrs_json
+    # Resolved next to this package rather than the working directory, and loaded once
+    return load_snapshot()
 
 
 def get_concept(tag: str):
     data = open_json()
-    concept, group = find_concept_group(data, tag)
+    concept, group = concept_index_for(data).find(tag)
     if concept:
         return {"concept": concept}
     else:
@@ -0,0 +1,56 @@
+"""
+One JSON codec for every parse / serialise hot path.
+
+orjson is used when it is installed, the stdlib json module otherwise (or when
+JSON_CODEC=json). Both produce the same compact UTF-8 output. Documents orjson rejects
+(NaN / Infinity literals, integers beyond 64 bits, non-string keys) fall back to the
+stdlib, so switching engines never changes what is accepted.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+if os.getenv('JSON_CODEC', 'orjson') == 'json':
+    orjson = None
+
+ENGINE = "orjson" if orjson else "json"
+
+
+def loads(data):
+    """Parse a JSON document given as bytes or str."""
+    if orjson:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj, indent=False, sort_keys=False):
+    """
+    Serialise `obj` to UTF-8 bytes; compact unless `indent`, True for two spaces or the
+    number of spaces (orjson only indents by two, other widths go through the stdlib).
+    """
+    width = 2 if indent is True else indent or 0
+    if orjson and width in (0, 2):
+        option = (orjson.OPT_INDENT_2 if width else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, indent=width or None,
+                      separators=(',', ': ') if width else (',', ':')).encode('utf-8')
+
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def write_json(path, obj, indent=False):
+    with open(path, 'wb') as f:
+        f.write(dumps(obj, indent=indent))
@@ -0,0 +1,125 @@
+import functools
+import re
+from types import MappingProxyType
+
+# One reference inside a (comma separated) references string, after whitespace has been
+# collapsed. Either "ESRS ESRS 2 <tag number>" (document "ESRS 2", tag number optional)
+# or "ESRS E1 <tag number>" (document "ESRS E1", tag number required).
+REFERENCE_GRAMMAR = re.compile(
+    r'^(?P<standard>ESRS) (?:'
+    r'ESRS (?P<numbered>\S+)(?: (?P<numbered_tag>.*))?'
+    r'|(?P<topical>\S+) (?P<topical_tag>.+)'
+    r')$'
+)
+
+# The paragraph number at the start of a tag number: "11 c SBM-3" -> "11"
+PARAGRAPH_NUMBER = re.compile(r'^(\d+)')
+
+
+def simplify_tag_number(tag_number):
+    """First integer at the start of `tag_number`, or `tag_number` itself if there is none."""
+    m = PARAGRAPH_NUMBER.search(tag_number.strip())
+    if m:
+        return m.group(1)
+    return tag_number
+
+
+def _parse_one(ref):
+    m = REFERENCE_GRAMMAR.match(' '.join(ref.split()))
+    if not m:
+        return MappingProxyType({"reference": ref})
+    if m.group('numbered') is not None:
+        document = f"ESRS {m.group('numbered')}"
+        tag_number = m.group('numbered_tag') or ''
+    else:
+        document = f"{m.group('standard')} {m.group('topical')}"
+        tag_number = m.group('topical_tag')
+    return MappingProxyType({
+        "standard": m.group('standard'),
+        "document": document,
+        "tag_number": tag_number
+    })
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_references(reference):
+    """
+    Parse a references string such as " ESRS ESRS 2 3 BP-1, ESRS E1 41 " into a tuple of
+    read-only mappings, one per reference mentioning ESRS. References that do not follow
+    the grammar come back as {"reference": <text>}.
+    """
+    return tuple(
+        _parse_one(ref)
+        for ref in (part.strip() for part in reference.strip().split(','))
+        if ref and 'ESRS' in ref
+    )
+
+
+class ReferenceResolver:
+    """
+    Resolves references strings to ESRS paragraph texts, once per distinct string.
+
+    Results are kept in an LRU of `maxsize` entries and returned as tuples of read-only
+    mappings, so callers cannot change what later lookups get back; use thaw() for plain
+    dicts. `get_text(parsed_ref)` looks up one parsed reference. With a `store`, cached
+    results are dropped once refresh() finds that the store reloaded a document; resolve()
+    itself never checks the store, so call refresh() once per report, not per fact.
+    """
+
+    def __init__(self, get_text, store=None, maxsize=4096):
+        self.get_text = get_text
+        self.store = store
+        self.generation = 0
+        self._resolve = functools.lru_cache(maxsize=maxsize)(self._resolve_uncached)
+
+    def _resolve_uncached(self, reference, generation):
+        if 'ESRS' not in reference:
+            return None
+        parsed_references = parse_references(reference)
+        if not parsed_references:
+            return None
+        results = []
+        for parsed_ref in parsed_references:
+            result = self.get_text(parsed_ref)
+            # Build a combined reference string: "ESRS S2 11 c SBM-3" for example
+            full_ref_str = f"{parsed_ref.get('document')} {parsed_ref.get('tag_number')}".strip()
+            if result:
+                results.append(MappingProxyType({**result, "reference": full_ref_str}))
+            else:
+                results.append(MappingProxyType({
+                    "message": f"Tag not found in {parsed_ref.get('document')} (or no text for '{parsed_ref.get('tag_number')}')",
+                    "reference": full_ref_str
+                }))
+        return tuple(results)
+
+    def refresh(self):
+        """Re-check the store's documents; results cached before a reload are not used again."""
+        if self.store is not None:
+            self.generation = self.store.refresh()
+        return self.generation
+
+    def resolve(self, reference):
+        """Tuple of read-only result mappings for `reference`, or None if it has no ESRS references."""
+        return self._resolve(reference, self.generation)
+
+    def cache_clear(self):
+        self._resolve.cache_clear()
+
+    def stats(self):
+        info = self._resolve.cache_info()
+        parse_info = parse_references.cache_info()
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "parse_hits": parse_info.hits,
+            "parse_misses": parse_info.misses,
+        }
+
+
+def thaw(results):
+    """Plain list of dicts for a resolve() result (None stays None)."""
+    if results is None:
+        return None
+    return [dict(result) for result in results]
@@ -0,0 +1,189 @@
+"""
+Streaming ESRS enrichment for OIM JSON reports too large to load at once.
+
+The report is read incrementally: every top-level member except "facts" is decoded as a
+whole, while the entries under "facts" are decoded, enriched and written out one at a
+time. Memory stays bounded by one fact plus the ESRS snapshot and its indexes.
+
+    python stream_enrich.py report.json enriched.json
+    python stream_enrich.py report.json enriched.ndjson --ndjson
+    cat report.json | python stream_enrich.py - - --ndjson
+
+With --ndjson every fact becomes one line {"id": <fact id>, "fact": {...}}; the other
+top-level members (documentInfo, ...) get a line of their own, {"<member>": <value>}.
+"""
+import argparse
+import json
+import re
+import sys
+
+import json_codec
+from concept_index import load_snapshot
+from fill_esrs import concept_lookup_for, enhance_fact_with_esrs_references, reference_resolver
+
+CHUNK_SIZE = 64 * 1024
+
+_NOT_WHITESPACE = re.compile(r'[^ \t\n\r]')
+
+
+def _encode(value):
+    return json_codec.dumps(value).decode('utf-8')
+
+
+class _IncrementalReader:
+    """Decodes one JSON value at a time from a text stream, reading it in chunks."""
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += chunk
+        return True
+
+    def peek(self):
+        """The next character that is not whitespace, without consuming it ('' at the end)."""
+        while True:
+            m = _NOT_WHITESPACE.search(self.buffer, self.pos)
+            if m:
+                self.pos = m.start()
+                return self.buffer[self.pos]
+            self.pos = len(self.buffer)
+            if not self._fill():
+                return ''
+
+    def expect(self, *chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset {self.pos}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number could still continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_report(fp, chunk_size=CHUNK_SIZE):
+    """
+    Yield the parts of an OIM JSON report as they are read:
+    ("member", name, value) for top-level members other than "facts",
+    ("facts_start",), then ("fact", fact_id, fact) per fact, then ("facts_end",).
+    """
+    reader = _IncrementalReader(fp, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == 'facts' and reader.peek() == '{':
+            reader.expect('{')
+            yield ("facts_start",)
+            if reader.peek() == '}':
+                reader.expect('}')
+            else:
+                while True:
+                    fact_id = reader.value()
+                    reader.expect(':')
+                    yield ("fact", fact_id, reader.value())
+                    if reader.expect(',', '}') == '}':
+                        break
+            yield ("facts_end",)
+        else:
+            yield ("member", name, reader.value())
+        if reader.expect(',', '}') == '}':
+            return
+
+
+def stream_enrich(source, target, esrs_reference_snapshot=None, ndjson=False, chunk_size=CHUNK_SIZE,
+                  fact_index=None):
+    """
+    Enrich the OIM JSON report read from the text stream `source` fact by fact and write
+    it to the text stream `target`, as one JSON document or (ndjson=True) as JSON Lines.
+    Uses the shared esrs_json.json snapshot unless one (raw or compact) is given, and adds every fact to
+    `fact_index` (a fact_index.FactIndex) if one is given. Returns the number of facts.
+    """
+    concept_index = concept_lookup_for(esrs_reference_snapshot or load_snapshot())
+    reference_resolver.refresh()
+    facts = 0
+    first_member = True
+    first_fact = True
+    for part in iter_report(source, chunk_size):
+        kind = part[0]
+        if kind == "fact":
+            _, fact_id, fact = part
+            enhance_fact_with_esrs_references(fact, concept_index)
+            if fact_index is not None:
+                fact_index.add(fact_id, fact)
+            facts += 1
+            if ndjson:
+                target.write(_encode({"id": fact_id, "fact": fact}) + '\n')
+            else:
+                target.write(('' if first_fact else ', ') + _encode(fact_id)
+                             + ': ' + _encode(fact))
+                first_fact = False
+        elif ndjson:
+            if kind == "member":
+                target.write(_encode({part[1]: part[2]}) + '\n')
+        elif kind == "facts_end":
+            target.write('}')
+        else:
+            target.write('{' if first_member else ', ')
+            first_member = False
+            if kind == "member":
+                target.write(_encode(part[1]) + ': '
+                             + _encode(part[2]))
+            else:
+                target.write('"facts": {')
+    if not ndjson:
+        target.write('{}' if first_member else '}')
+    return facts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add ESRS references to a large OIM JSON report, one fact at a time.")
+    parser.add_argument("input", help="OIM JSON report ('-' for stdin)")
+    parser.add_argument("output", help="enriched report ('-' for stdout)")
+    parser.add_argument("--ndjson", action="store_true", help="write one fact per line instead of one JSON document")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        facts = stream_enrich(source, target, ndjson=args.ndjson)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    print(f"Enriched {facts} facts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Memory and lookup latency of the ESRS presentation snapshot: the raw json.load tree
+against utils/compact_snapshot.py.
+
+    python benchmarks/compact_snapshot.py
+"""
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'utils'))
+
+from compact_snapshot import CompactSnapshot, find_concept_group as compact_find_concept_group  # noqa: E402
+from concept_index import ConceptIndex  # noqa: E402
+from find_concept_group import find_concept  # noqa: E402
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'esrs_data',
+                             'esrs_json.json')
+
+
+def measure(build):
+    """(result, seconds, bytes retained) of calling build()."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, seconds, retained
+
+
+def load_raw():
+    with open(SNAPSHOT_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_compact():
+    return CompactSnapshot(load_raw())
+
+
+def raw_find_concept_group(data, tag):
+    # The recursive walk every lookup used to do
+    for item in data['presentation']:
+        result = find_concept(item, tag)
+        if result:
+            return result, item
+    return None, None
+
+
+def per_lookup(lookup, names, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for name in names:
+            lookup(name)
+    return (time.perf_counter() - started) / (len(names) * repeat)
+
+
+def main():
+    raw, raw_seconds, raw_bytes = measure(load_raw)
+    compact, compact_seconds, compact_bytes = measure(load_compact)
+    index, index_seconds, index_bytes = measure(lambda: ConceptIndex(raw))
+    names = list(compact.concepts)
+
+    print(f"file size                      {os.path.getsize(SNAPSHOT_PATH) / 2**20:8.2f} MiB")
+    print(f"raw json.load tree             {raw_bytes / 2**20:8.2f} MiB  loaded in {raw_seconds * 1000:7.1f} ms")
+    print(f"compact tree                   {compact_bytes / 2**20:8.2f} MiB  loaded in {compact_seconds * 1000:7.1f} ms")
+    print(f"concept index over raw tree  + {index_bytes / 2**20:8.2f} MiB  built in  {index_seconds * 1000:7.1f} ms")
+    print()
+    print(f"lookups over {len(names)} concept names (per lookup):")
+    sample = names[::20]
+    print(f"  recursive walk of raw tree   {per_lookup(lambda n: raw_find_concept_group(raw, n), sample) * 1e6:10.2f} us")
+    print(f"  concept index (raw tree)     {per_lookup(index.find, names, 100) * 1e6:10.2f} us")
+    print(f"  compact node                 {per_lookup(compact.get, names, 100) * 1e6:10.2f} us")
+    print(f"  compact list adapter         {per_lookup(lambda n: compact_find_concept_group(compact, n), names, 100) * 1e6:10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Parse / serialise times of the bundled reports: the stdlib json calls the services used
+to make against utils/json_codec.py (orjson when installed, see json_codec.ENGINE).
+
+    python benchmarks/json_codec.py
+    JSON_CODEC=json python benchmarks/json_codec.py   # the codec's stdlib fallback
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'utils'))
+
+import json_codec  # noqa: E402
+
+ESRS_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'esrs_data')
+FILES = ('example_filled.json', 'enhanced_report.json', 'esrs_json.json')
+
+
+def best_of(run, repeat=20):
+    """Fastest of `repeat` runs of run(), in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    print(f"json_codec engine: {json_codec.ENGINE}")
+    print(f"{'file':24} {'operation':18} {'stdlib ms':>10} {'codec ms':>10} {'speedup':>8}")
+    for name in FILES:
+        path = os.path.join(ESRS_DATA, name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        text = data.decode('utf-8')
+        document = json.loads(text)
+        assert json_codec.loads(data) == document
+
+        cases = (
+            ("parse", lambda: json.loads(text), lambda: json_codec.loads(data)),
+            ("serialise", lambda: json.dumps(document, ensure_ascii=False).encode('utf-8'),
+             lambda: json_codec.dumps(document)),
+            ("serialise indented", lambda: json.dumps(document, indent=4, ensure_ascii=False).encode('utf-8'),
+             lambda: json_codec.dumps(document, indent=True)),
+        )
+        for operation, stdlib, codec in cases:
+            before, after = best_of(stdlib), best_of(codec)
+            print(f"{name:24} {operation:18} {before:10.2f} {after:10.2f} {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Stand-in for the Arelle service, for benchmarking the backend without Arelle installed.
+
+POST /convert/ reads the upload and answers a fixed OIM JSON document (by default
+backend/esrs_data/example_filled.json) after an optional delay that mimics conversion
+time. X-Result-Key is the hash of the upload, so distinct uploads miss the backend's
+enrichment cache just as they would with the real service.
+
+    python benchmarks/stub_arelle.py --port 8012 --delay 0.05
+"""
+import argparse
+import hashlib
+import http.server
+import os
+import threading
+import time
+
+DEFAULT_DOCUMENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'esrs_data',
+                                'example_filled.json')
+
+
+class StubArelleHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by make_server()
+    document = b''
+    delay = 0.0
+
+    def do_GET(self):
+        self._answer(200, b'{"status":"ok"}')
+
+    def do_POST(self):
+        upload = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/convert/'):
+            self._answer(404, b'{"detail":"Not Found"}')
+            return
+        if self.delay:
+            time.sleep(self.delay)
+        self._answer(200, self.document, {
+            "X-Cache": "MISS",
+            "X-Result-Key": hashlib.sha256(upload).hexdigest(),
+        })
+
+    def _answer(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=0, document_path=DEFAULT_DOCUMENT, delay=0.0):
+    """A threading HTTP server bound to 127.0.0.1:`port` (0 picks a free port)."""
+    with open(document_path, 'rb') as f:
+        document = f.read()
+    handler = type("Handler", (StubArelleHandler,), {"document": document, "delay": delay})
+    return http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def start_in_thread(port=0, document_path=DEFAULT_DOCUMENT, delay=0.0):
+    """Serve from a daemon thread; returns the server (server.server_address has the port)."""
+    server = make_server(port, document_path, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Arelle service answering a fixed OIM JSON document.")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--document", default=DEFAULT_DOCUMENT, help="OIM JSON document to answer with")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+    server = make_server(args.port, args.document, args.delay)
+    print(f"Stub Arelle service on http://127.0.0.1:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,592 @@
+"""
+Reproducible benchmark suite for conversion and enrichment throughput. Runs offline.
+
+In-process benchmarks (each in a fresh interpreter, so peak RSS is its own):
+    enrich_example        enhance_report_with_esrs_references on example_filled.json
+    enrich_10k            the same on a synthetic report of 10,000 facts
+    enrich_100k           ... and of 100,000 facts
+    parse_reference       fill_esrs.parse_reference over every references string of the
+                          snapshot, with its LRU cleared before each pass
+    parse_reference_warm  the same with the LRU kept
+    get_esrs_text         fill_esrs.get_esrs_text for every parsed reference
+
+End-to-end load tests, against --arelle-url / --backend-url or, when they are not given,
+against instances started locally on free ports (the backend behind stub_arelle.py):
+    convert               POST /convert/, a distinct upload per request (result cache misses)
+    convert_cached        POST /convert/, the same upload every time (result cache hits)
+    upload_file           POST /upload_file
+    upload_file_esrs      POST /upload_file with enrich=esrs
+
+Every benchmark reports latency percentiles, throughput and peak RSS. Results are written
+as JSON and compared against a saved baseline; the exit status is 1 on a regression.
+
+    python benchmarks/suite.py --output benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json
+    python benchmarks/suite.py --only enrich_example,parse_reference --quick
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import platform
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+UTILS_DIR = os.path.join(REPO, 'backend', 'utils')
+ESRS_DATA = os.path.join(REPO, 'backend', 'esrs_data')
+
+import stub_arelle
+
+# Ahead of this directory, whose json_codec.py is a benchmark of the module of that name
+sys.path.insert(0, UTILS_DIR)
+
+import json_codec  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Metrics compared against the baseline and which direction is better
+COMPARED = {
+    "latency_ms.p50": "lower",
+    "latency_ms.p90": "lower",
+    "latency_ms.p99": "lower",
+    "throughput": "higher",
+    "peak_rss_mb": "lower",
+    "server_peak_rss_mb": "lower",
+}
+
+
+#######################################################
+# Measurements
+#######################################################
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def summarise(samples, unit):
+    """
+    Result of a benchmark from its (seconds, items) samples: latency percentiles of one
+    sample in milliseconds and throughput in `unit` per second.
+    """
+    latencies = sorted(seconds * 1000 for seconds, _ in samples)
+    total_seconds = sum(seconds for seconds, _ in samples)
+    total_items = sum(items for _, items in samples)
+    return {
+        "samples": len(samples),
+        "latency_ms": {
+            "min": latencies[0],
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1],
+            "mean": total_seconds * 1000 / len(samples),
+        },
+        "throughput": total_items / total_seconds if total_seconds else None,
+        "throughput_unit": f"{unit}/s",
+    }
+
+
+def own_peak_rss_mb():
+    """Peak resident set size of this process."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def process_tree(pid):
+    """`pid` and its descendants, from /proc (Linux only)."""
+    pids = [pid]
+    for current in pids:
+        task_dir = f"/proc/{current}/task"
+        try:
+            for tid in os.listdir(task_dir):
+                with open(os.path.join(task_dir, tid, "children")) as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_peak_rss_mb(pid):
+    """Sum of the peak RSS (VmHWM) of `pid` and its descendants, e.g. a service and its workers."""
+    total_kb = None
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total_kb = (total_kb or 0) + int(line.split()[1])
+        except OSError:
+            pass
+    return total_kb / 2**10 if total_kb is not None else None
+
+
+def timed(run, iterations, warmup=1, prepare=None):
+    """
+    (seconds, items) of `iterations` calls of run(prepared) after `warmup` untimed ones;
+    prepare() builds each call's input outside the timing, run() returns the item count.
+    """
+    samples = []
+    for iteration in range(warmup + iterations):
+        prepared = prepare() if prepare else None
+        started = time.perf_counter()
+        items = run(prepared)
+        seconds = time.perf_counter() - started
+        if iteration >= warmup:
+            samples.append((seconds, items))
+    return samples
+
+
+#######################################################
+# In-process benchmarks
+#######################################################
+def synthetic_report(fact_count, template, concepts):
+    """
+    OIM JSON report of `fact_count` facts: the facts of `template` repeated with fresh ids,
+    entities and periods, every other one switched to a concept of the snapshot.
+    """
+    template_facts = list(template["facts"].values())
+    facts = {}
+    for i in range(fact_count):
+        fact = template_facts[i % len(template_facts)]
+        dimensions = dict(fact.get("dimensions", {}))
+        if i % 2:
+            dimensions["concept"] = concepts[i % len(concepts)]
+        dimensions["entity"] = f"scheme:entity-{i % 97}"
+        year = 2020 + i % 8
+        dimensions["period"] = f"{year}-01-01T00:00:00/{year + 1}-01-01T00:00:00"
+        facts[f"fact-{i}"] = {**fact, "dimensions": dimensions}
+    return {"documentInfo": template["documentInfo"], "facts": facts}
+
+
+def _snapshot_references():
+    from compact_snapshot import CompactSnapshot
+    from concept_index import concept_index_for, load_snapshot
+
+    snapshot = load_snapshot()
+    index = concept_index_for(snapshot)
+    references = {index.get(name)[2] for name in CompactSnapshot(snapshot).concepts}
+    return sorted(reference for reference in references if reference)
+
+
+def bench_enrich(fact_count, iterations):
+    import fill_esrs
+    from compact_snapshot import CompactSnapshot
+    from concept_index import load_snapshot
+    from esrs_text_store import default_store
+
+    snapshot = load_snapshot()
+    default_store().load_all()
+    with open(os.path.join(ESRS_DATA, 'example_filled.json'), 'rb') as f:
+        example = f.read()
+    if fact_count is None:
+        prepare = lambda: json_codec.loads(example)  # noqa: E731
+    else:
+        template = json_codec.loads(example)
+        concepts = sorted(CompactSnapshot(snapshot).concepts)
+        prepare = lambda: synthetic_report(fact_count, template, concepts)  # noqa: E731
+
+    def run(report):
+        fill_esrs.enhance_report_with_esrs_references(report, snapshot)
+        return len(report["facts"])
+
+    return summarise(timed(run, iterations, prepare=prepare), "facts")
+
+
+def bench_parse_reference(iterations, warm):
+    import fill_esrs
+    from reference_resolver import parse_references
+
+    references = _snapshot_references()
+
+    def run(_):
+        if not warm:
+            parse_references.cache_clear()
+        for reference in references:
+            fill_esrs.parse_reference(reference)
+        return len(references)
+
+    return summarise(timed(run, iterations), "references")
+
+
+def bench_get_esrs_text(iterations):
+    import fill_esrs
+    from esrs_text_store import default_store
+
+    default_store().load_all()
+    parsed = [parsed_ref for reference in _snapshot_references()
+              for parsed_ref in fill_esrs.parse_reference(reference) if parsed_ref.get("tag_number")]
+
+    def run(_):
+        for parsed_ref in parsed:
+            fill_esrs.get_esrs_text(parsed_ref)
+        return len(parsed)
+
+    return summarise(timed(run, iterations), "lookups")
+
+
+def in_process_benchmarks(quick):
+    scale = 0.25 if quick else 1
+    return {
+        "enrich_example": lambda: bench_enrich(None, max(3, int(40 * scale))),
+        "enrich_10k": lambda: bench_enrich(10_000, max(2, int(8 * scale))),
+        "enrich_100k": lambda: bench_enrich(100_000, max(1, int(3 * scale))),
+        "parse_reference": lambda: bench_parse_reference(max(3, int(50 * scale)), warm=False),
+        "parse_reference_warm": lambda: bench_parse_reference(max(3, int(200 * scale)), warm=True),
+        "get_esrs_text": lambda: bench_get_esrs_text(max(3, int(50 * scale))),
+    }
+
+
+def _run_isolated(name, quick, results):
+    result = in_process_benchmarks(quick)[name]()
+    result["peak_rss_mb"] = own_peak_rss_mb()
+    results.put(result)
+
+
+def run_isolated(name, quick):
+    """Run one in-process benchmark in a fresh interpreter and return its result."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_isolated, args=(name, quick, results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                return {"skipped": f"benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+#######################################################
+# End-to-end load tests
+#######################################################
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalService:
+    """A service directory's app:app run by uvicorn on a free port, until stop()."""
+
+    def __init__(self, directory, health_path, env=None, timeout=120):
+        self.directory = directory
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(self.port)],
+            cwd=directory, env={**os.environ, **(env or {})}, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        self._wait_ready(health_path, timeout)
+
+    def _wait_ready(self, health_path, timeout):
+        import httpx
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                if httpx.get(self.url + health_path, timeout=2).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        self._log.seek(0)
+        raise RuntimeError(f"service in {self.directory} did not start:\n"
+                           f"{self._log.read().decode(errors='replace')[-2000:]}")
+
+    def peak_rss_mb(self):
+        return tree_peak_rss_mb(self.process.pid)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+
+def synthetic_instance(fact_count):
+    """A self-contained XBRL 2.1 instance of `fact_count` numeric facts (no taxonomy needed)."""
+    facts = "\n".join(
+        f'  <ex:Amount{i % 50} contextRef="c{i % 4}" unitRef="EUR" decimals="0">{i * 1000}</ex:Amount{i % 50}>'
+        for i in range(fact_count)
+    )
+    contexts = "\n".join(
+        f'  <xbrli:context id="c{i}"><xbrli:entity><xbrli:identifier scheme="http://example.com">ACME'
+        f'</xbrli:identifier></xbrli:entity><xbrli:period><xbrli:instant>{2021 + i}-12-31</xbrli:instant>'
+        f'</xbrli:period></xbrli:context>'
+        for i in range(4)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance" '
+        'xmlns:link="http://www.xbrl.org/2003/linkbase" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        'xmlns:iso4217="http://www.xbrl.org/2003/iso4217" xmlns:ex="http://example.com/benchmark">\n'
+        f'{contexts}\n'
+        '  <xbrli:unit id="EUR"><xbrli:measure>iso4217:EUR</xbrli:measure></xbrli:unit>\n'
+        f'{facts}\n'
+        '</xbrli:xbrl>\n'
+    ).encode('utf-8')
+
+
+def distinct_upload(body, filename, i):
+    """`body` made unique per request, for formats where a trailing XML comment is harmless."""
+    if filename.lower().endswith(('.xbrl', '.xml', '.xhtml', '.html', '.htm')):
+        return body + f"\n<!-- benchmark request {i} -->\n".encode()
+    return None
+
+
+async def load_test(url, make_request, requests, concurrency):
+    """(seconds, 1) of each of `requests` requests, `concurrency` at a time, and the error count."""
+    import httpx
+
+    samples = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=600) as client:
+
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await make_request(client, i)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                samples.append((time.perf_counter() - started, 1))
+
+        # One untimed request first, so connection setup and lazy loading are not measured
+        await make_request(client, -1)
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall_seconds = time.perf_counter() - started
+
+    result = summarise(samples, "requests")
+    # Requests overlap, so throughput is over wall-clock time rather than summed latencies
+    result["throughput"] = requests / wall_seconds
+    result["errors"] = errors
+    result["concurrency"] = concurrency
+    return result
+
+
+def convert_benchmarks(args):
+    if args.xbrl:
+        filename = os.path.basename(args.xbrl)
+        with open(args.xbrl, 'rb') as f:
+            body = f.read()
+    else:
+        filename, body = "benchmark.xbrl", synthetic_instance(args.instance_facts)
+
+    def unique(client, i):
+        return client.post("/convert/", files={"file": (filename, distinct_upload(body, filename, i))})
+
+    def cached(client, i):
+        return client.post("/convert/", files={"file": (filename, body)})
+
+    benchmarks = {"convert_cached": cached}
+    if distinct_upload(body, filename, 0) is not None:
+        benchmarks["convert"] = unique
+    return benchmarks
+
+
+def upload_benchmarks(args):
+    body = synthetic_instance(args.instance_facts)
+
+    def upload(enrich):
+        def make_request(client, i):
+            data = {"websocket_user_id": "benchmark"}
+            if enrich:
+                data["enrich"] = enrich
+            return client.post("/upload_file", data=data,
+                               files={"file": ("benchmark.xbrl", distinct_upload(body, "benchmark.xbrl", i))})
+        return make_request
+
+    return {"upload_file": upload(None), "upload_file_esrs": upload("esrs")}
+
+
+def run_load_tests(names, url, start_service, benchmarks, args):
+    """Run the selected `benchmarks` against `url`, or a service start_service() brings up."""
+    selected = {name: request for name, request in benchmarks.items() if name in names}
+    if not selected:
+        return {}
+    service = None
+    try:
+        if not url:
+            service = start_service()
+            url = service.url
+    except Exception as e:
+        return {name: {"skipped": str(e)} for name in selected}
+    results = {}
+    try:
+        for name, make_request in selected.items():
+            print(f"  {name} ...", flush=True)
+            results[name] = asyncio.run(load_test(url, make_request, args.requests, args.concurrency))
+            results[name]["server_peak_rss_mb"] = service.peak_rss_mb() if service else None
+    finally:
+        if service:
+            service.stop()
+    return results
+
+
+def start_arelle_service():
+    cache_dir = tempfile.mkdtemp(prefix="benchmark-arelle-cache-")
+    return LocalService(os.path.join(REPO, 'arelle_service'), "/pool/stats", env={
+        "ARELLE_RESULT_CACHE_DIR": cache_dir,
+        # No taxonomy entry points to warm up, so the service starts offline
+        "ARELLE_WARM_ENTRYPOINTS": os.environ.get("ARELLE_WARM_ENTRYPOINTS", ""),
+    })
+
+
+def start_backend(stub_delay):
+    stub = stub_arelle.start_in_thread(delay=stub_delay)
+    return LocalService(os.path.join(REPO, 'backend'), "/", env={
+        "ARELLE_URL": f"http://127.0.0.1:{stub.server_address[1]}",
+        "ENRICH_CACHE_DIR": tempfile.mkdtemp(prefix="benchmark-enrichment-cache-"),
+        "CORPUS_DB": "",
+    })
+
+
+#######################################################
+# Baseline comparison
+#######################################################
+def metric(result, path):
+    value = result
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every compared metric, and the list of regressions beyond `tolerance`."""
+    lines, regressions = [], []
+    for name, result in results.items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before or "skipped" in result or "skipped" in before:
+            continue
+        for path, better in COMPARED.items():
+            old, new = metric(before, path), metric(result, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if better == "lower" else change < -tolerance
+            line = f"{name:22} {path:20} {old:12.3f} {new:12.3f} {change * 100:+7.1f}%{'  REGRESSION' if worse else ''}"
+            lines.append(line)
+            if worse:
+                regressions.append(line)
+    return lines, regressions
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "json_codec": json_codec.ENGINE,
+    }
+
+
+def print_result(name, result):
+    if "skipped" in result:
+        print(f"{name:22} skipped: {result['skipped'].splitlines()[0]}")
+        return
+    latency = result["latency_ms"]
+    rss = result.get("peak_rss_mb") or result.get("server_peak_rss_mb")
+    print(f"{name:22} p50 {latency['p50']:10.3f} ms  p90 {latency['p90']:10.3f} ms  p99 {latency['p99']:10.3f} ms  "
+          f"{result['throughput']:12.1f} {result['throughput_unit']:14} "
+          + (f"peak RSS {rss:8.1f} MiB" if rss is not None else ""))
+
+
+def main(argv=None):
+    in_process = list(in_process_benchmarks(False))
+    end_to_end = ["convert", "convert_cached", "upload_file", "upload_file_esrs"]
+    parser = argparse.ArgumentParser(description="Benchmark conversion and enrichment throughput.")
+    parser.add_argument("--only", help=f"comma separated benchmarks out of {', '.join(in_process + end_to_end)}")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a smoke run")
+    parser.add_argument("--no-e2e", action="store_true", help="skip the end-to-end load tests")
+    parser.add_argument("--output", help="write the results as JSON (e.g. to save a new baseline)")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change of a metric counted as a regression (default 0.2)")
+    parser.add_argument("--arelle-url", help="running Arelle service to load test instead of a local one")
+    parser.add_argument("--backend-url", help="running backend to load test instead of a local one")
+    parser.add_argument("--xbrl", help="filing uploaded to /convert/ instead of a synthetic instance")
+    parser.add_argument("--instance-facts", type=int, default=200, help="facts of the synthetic instance")
+    parser.add_argument("--requests", type=int, default=50, help="requests per load test")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight per load test")
+    parser.add_argument("--stub-delay", type=float, default=0.0,
+                        help="seconds the stub Arelle service takes per conversion")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else in_process + ([] if args.no_e2e else end_to_end)
+    unknown = set(names) - set(in_process + end_to_end)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    if args.quick:
+        args.requests = min(args.requests, 10)
+
+    results = {}
+    for name in (name for name in in_process if name in names):
+        print(f"  {name} ...", flush=True)
+        results[name] = run_isolated(name, args.quick)
+    results.update(run_load_tests(names, args.arelle_url, start_arelle_service, convert_benchmarks(args), args))
+    results.update(run_load_tests(names, args.backend_url, lambda: start_backend(args.stub_delay),
+                                  upload_benchmarks(args), args))
+
+    print()
+    for name, result in results.items():
+        print_result(name, result)
+
+    report = {"meta": metadata(), "benchmarks": results}
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(json_codec.dumps(report, indent=True))
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        baseline = json_codec.read_json(args.baseline)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nAgainst {args.baseline} (commit {baseline.get('meta', {}).get('commit')}):")
+        print(f"{'benchmark':22} {'metric':20} {'baseline':>12} {'current':>12} {'change':>8}")
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance * 100:.0f}%")
+            return 1
+        print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())